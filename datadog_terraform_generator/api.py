@@ -1,21 +1,79 @@
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from datadog_terraform_generator.rate_limit import (
+    DEFAULT_MAX_RETRIES,
+    RETRY_STATUS_CODES,
+    backoff_seconds,
+    get_rate_limiter,
+)
+
+DEFAULT_POOL_SIZE = 10
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE, keep_alive=True) -> requests.Session:
+    """
+    Returns a requests session with a connection pool of pool_size connections.
+    Sessions are shared by every DdApi in the process that asks for the same pool
+    settings, that way subsequent calls (and subcommands) reuse the open TCP+TLS
+    connections in stead of doing a new handshake for every request.
+    """
+    key = (pool_size, keep_alive)
+    with _sessions_lock:
+        if key not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            _sessions[key] = session
+        return _sessions[key]
 
 
 class DdApi:
-    def __init__(self, api_host, api_key, app_key):
+    def __init__(
+        self,
+        api_host,
+        api_key,
+        app_key,
+        pool_size=DEFAULT_POOL_SIZE,
+        keep_alive=True,
+        max_retries=DEFAULT_MAX_RETRIES,
+    ):
         self.api_host = api_host
         self.api_key = api_key
         self.app_key = app_key
+        self.max_retries = max_retries
+        self.session = get_session(pool_size=pool_size, keep_alive=keep_alive)
+        self.rate_limiter = get_rate_limiter(api_key)
+        self.headers = self.get_headers()
 
     def request(self, path, data=None):
-        if data is None:
-            req = requests.get(
-                url=self.check_url(path),
-                headers=self.get_headers(),
-            )
-        else:
-            req = requests.post(
-                url=self.check_url(path), headers=self.get_headers(), json=data
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(path)
+            if data is None:
+                req = self.session.get(
+                    url=self.check_url(path),
+                    headers=self.headers,
+                )
+            else:
+                req = self.session.post(
+                    url=self.check_url(path), headers=self.headers, json=data
+                )
+            self.rate_limiter.on_response(path, req.headers)
+            if req.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                break
+            time.sleep(
+                backoff_seconds(
+                    attempt, req.headers if req.status_code == 429 else None
+                )
             )
         return self.read_response(req)
 
@@ -25,6 +83,7 @@ class DdApi:
             "DD-APPLICATION-KEY": self.app_key,
             "Content-Type": "application/json",
             "Accept": "application/json",
+            "Accept-Encoding": "gzip",
         }
 
     def check_url(self, path):
@@ -34,15 +93,6 @@ class DdApi:
         return url
 
     def read_response(self, req):
-        if req.status_code == 429:
-            print(
-                "Max requests per second:",
-                int(req.headers["x-ratelimit-limit"])
-                / int(req.headers["x-ratelimit-period"]),
-                "\nOr sleep time:",
-                int(req.headers["x-ratelimit-period"])
-                / int(req.headers["x-ratelimit-limit"]),
-            )
         req.raise_for_status()
         data = req.json()
         if data.get("status", "") == "error":
@@ -50,9 +100,16 @@ class DdApi:
         return data
 
     @classmethod
-    def from_config(cls, config):
+    def from_config(cls, config, concurrency=0):
+        """
+        concurrency is the number of requests the caller has in flight at the same
+        time, the connection pool holds at least that many connections
+        """
         return cls(
             api_host=config["datadog_url"],
             api_key=config["api_key"],
             app_key=config["app_key"],
+            pool_size=max(config.get("pool_size", DEFAULT_POOL_SIZE), concurrency),
+            keep_alive=config.get("keep_alive", True),
+            max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
         )
@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Iterable, List, Optional, Tuple, Union
+
+from datadog_terraform_generator.api import DdApi
+from datadog_terraform_generator.pagination import DEFAULT_CONCURRENCY
+
+RequestSpec = Union[str, Tuple[str, Optional[dict]]]
+
+
+def split_request_spec(spec: RequestSpec):
+    if isinstance(spec, str):
+        return spec, None
+    return spec
+
+
+class AsyncDdApi:
+    """
+    Async counterpart of DdApi with the same request(path, data) contract, for
+    callers that already run an event loop. The subcommands are synchronous, they
+    fetch in parallel with the pagination helpers in stead.
+    At most `concurrency` requests are in flight at the same time. The calls run
+    on the pooled session of the wrapped DdApi in worker threads, so rate limiting
+    and retries behave exactly as they do for DdApi.
+    """
+
+    def __init__(self, dd_api: DdApi, concurrency=DEFAULT_CONCURRENCY):
+        self.dd_api = dd_api
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore = None
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        # created lazily so it's bound to the running event loop
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.semaphore
+
+    async def request(self, path, data=None):
+        async with self.get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, partial(self.dd_api.request, path, data)
+            )
+
+    async def gather(self, specs: Iterable[RequestSpec]) -> List:
+        """
+        Requests all paths (or (path, data) tuples) and returns the responses in
+        the same order as they were given.
+        """
+        return await asyncio.gather(
+            *(self.request(*split_request_spec(spec)) for spec in specs)
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    @classmethod
+    def from_config(cls, config, concurrency=DEFAULT_CONCURRENCY):
+        return cls(DdApi.from_config(config, concurrency), concurrency=concurrency)
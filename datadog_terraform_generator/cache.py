@@ -0,0 +1,200 @@
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from os.path import expanduser, join
+from typing import Any, Dict, Tuple
+
+CACHE_DIR = join(
+    os.environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache"),
+    "datadog_terraform_generator",
+)
+CACHE_FILE_NAME = "cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 100_000
+# counting the entries of a namespace isn't free, so we check every so many sets
+EVICT_EVERY_SETS = 100
+# reads don't write, unless the access time of the entry is older than this, so
+# the least recently used order is only this precise
+ACCESS_REFRESH_SECONDS = 60 * 60
+# hits and misses are counted in memory and written every so many reads
+STATS_FLUSH_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (namespace, accessed_at);
+CREATE TABLE IF NOT EXISTS stats (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class SqliteCache:
+    """
+    Key value cache in a sqlite file shared by all caches (namespaces) and all
+    processes. Every entry has its own expiry time, when a namespace holds more
+    than max_entries the least recently used entries are evicted.
+    sqlite takes care of the locking between processes, WAL mode lets readers
+    continue while another process writes.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_age_seconds=None,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        path=None,
+    ):
+        self.namespace = namespace
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self.path = path or join(CACHE_DIR, CACHE_FILE_NAME)
+        self.sets_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.stats_lock = threading.Lock()
+        # sqlite connections can't be shared between threads
+        self.local = threading.local()
+        self.purge_expired()
+        atexit.register(self.flush_stats)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if not hasattr(self.local, "connection"):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+        return self.local.connection
+
+    def count(self, hit: bool):
+        with self.stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            pending = self.hits + self.misses
+        if pending >= STATS_FLUSH_EVERY:
+            self.flush_stats()
+
+    def flush_stats(self):
+        with self.stats_lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+        if hits or misses:
+            self.connection.execute(
+                "INSERT INTO stats (namespace, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace) DO UPDATE SET "
+                "hits = hits + excluded.hits, misses = misses + excluded.misses",
+                (self.namespace, hits, misses),
+            )
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT value, accessed_at FROM entries WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self.namespace, key, now),
+        ).fetchone()
+        if row is None:
+            self.count(hit=False)
+            return False, None
+        value, accessed_at = row
+        if now - accessed_at > ACCESS_REFRESH_SECONDS:
+            self.connection.execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+        self.count(hit=True)
+        return True, pickle.loads(value)
+
+    def set(self, key: str, value: Any, ttl_seconds=None):
+        now = time.time()
+        ttl_seconds = ttl_seconds or self.max_age_seconds
+        expires_at = now + ttl_seconds if ttl_seconds else None
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries "
+            "(namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, pickle.dumps(value), expires_at, now),
+        )
+        self.sets_since_evict += 1
+        if self.sets_since_evict >= EVICT_EVERY_SETS:
+            self.evict()
+
+    def delete(self, key: str):
+        self.connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        )
+
+    def evict(self):
+        self.sets_since_evict = 0
+        self.connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key IN ("
+            "SELECT key FROM entries WHERE namespace = ? "
+            "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
+        )
+
+    def purge_expired(self):
+        self.connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, time.time()),
+        )
+
+    def clear(self):
+        self.connection.execute(
+            "DELETE FROM entries WHERE namespace = ?", (self.namespace,)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        self.flush_stats()
+        row = self.connection.execute(
+            "SELECT hits, misses FROM stats WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        entries = self.connection.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        hits, misses = row or (0, 0)
+        return {"entries": entries, "hits": hits, "misses": misses}
+
+
+def list_namespaces(path=None):
+    cache = SqliteCache("", path=path)
+    rows = cache.connection.execute(
+        "SELECT namespace FROM stats UNION SELECT namespace FROM entries"
+    ).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def cache_stats(args):
+    for namespace in list_namespaces():
+        cache = SqliteCache(namespace)
+        if args.clear:
+            cache.clear()
+        stats = cache.stats()
+        print(
+            f"{namespace}: {stats['entries']} entries, "
+            f"{stats['hits']} hits, {stats['misses']} misses"
+        )
+
+
+def add_sub_parser(subparsers):
+    parser = subparsers.add_parser(
+        "cache_stats", help=f"Show hit/miss statistics of the cache in {CACHE_DIR}"
+    )
+    parser.add_argument(
+        "--clear", help="Remove all cached entries", action="store_true"
+    )
+    parser.set_defaults(func=cache_stats)
@@ -0,0 +1,51 @@
+import heapq
+import pickle
+import tempfile
+from typing import Any, Callable, Iterable, Iterator, List
+
+DEFAULT_MAX_IN_MEMORY = 50_000
+
+
+def spill(items: List[Any]):
+    """
+    Writes sorted items to an anonymous temp file, it's removed once closed
+    """
+    fl = tempfile.TemporaryFile()
+    for item in items:
+        pickle.dump(item, fl, protocol=pickle.HIGHEST_PROTOCOL)
+    fl.seek(0)
+    return fl
+
+
+def read_spilled(fl) -> Iterator[Any]:
+    with fl:
+        while True:
+            try:
+                yield pickle.load(fl)
+            except EOFError:
+                return
+
+
+def external_sort(
+    items: Iterable[Any],
+    key: Callable[[Any], Any],
+    max_in_memory=DEFAULT_MAX_IN_MEMORY,
+) -> Iterator[Any]:
+    """
+    sorted(items, key=key) that holds at most max_in_memory items in memory.
+    Items are sorted in runs of max_in_memory items that are spilled to temp files,
+    the runs are merged while reading them back. Items need to be picklable.
+    """
+    runs = []
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= max_in_memory:
+            chunk.sort(key=key)
+            runs.append(read_spilled(spill(chunk)))
+            chunk = []
+    chunk.sort(key=key)
+    if not runs:
+        yield from chunk
+        return
+    yield from heapq.merge(*runs, iter(chunk), key=key)
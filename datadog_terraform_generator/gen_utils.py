@@ -3,23 +3,15 @@ import hashlib
 import json
 import os
 import re
-import shelve
-import stat
 import subprocess
 import sys
-import time
-from os.path import isfile
 from typing import Dict, Any, List
 
 from argcomplete.completers import ChoicesCompleter
 
+from datadog_terraform_generator.cache import SqliteCache
 from datadog_terraform_generator.config_management import load_config, list_config_names
 
-dir_path = os.path.dirname(os.path.realpath(__file__))
-CACHE_DIR = os.path.join(dir_path, ".cache")
-if not os.path.isdir(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
-
 
 def get_local_abs_path(file_name):
     return os.path.join(os.path.dirname(__file__), file_name)
@@ -247,33 +239,27 @@ def hash_args_kwargs(args, kwargs):
     return hashlib.md5(key.encode("utf-8")).hexdigest()
 
 
-def file_age_in_seconds(pathname):
-    if isfile(pathname):
-        return time.time() - os.stat(pathname)[stat.ST_MTIME]
-    return -1
-
-
 def file_cached(func, max_cache_age_seconds=None, printing_enabled=False):
-    cache_path = os.path.join(CACHE_DIR, func.__name__)
-    if max_cache_age_seconds:
-        if file_age_in_seconds(cache_path) > max_cache_age_seconds:
-            os.remove(cache_path)
-
-    shelve_storage = shelve.open(cache_path)
+    """
+    Caches the results of func in the shared sqlite cache, per set of arguments.
+    Every result expires max_cache_age_seconds after it was stored. Results that
+    are a dict with an error in it are not cached.
+    """
+    cache = SqliteCache(func.__name__, max_age_seconds=max_cache_age_seconds)
 
     def wrapper(*args, **kwargs):
-
         key_hash = hash_args_kwargs(args, kwargs)
-        if key_hash not in shelve_storage:
-            if printing_enabled:
-                print(f"{func.__name__} {key_hash} {args} {kwargs}")
-            shelve_storage[key_hash] = func(*args, **kwargs)
-        if isinstance(shelve_storage[key_hash], dict) and shelve_storage[key_hash].get(
-            "error"
-        ):
-            del shelve_storage[key_hash]
-        return shelve_storage[key_hash]
-
+        found, result = cache.get(key_hash)
+        if found:
+            return result
+        if printing_enabled:
+            print(f"{func.__name__} {key_hash} {args} {kwargs}")
+        result = func(*args, **kwargs)
+        if not (isinstance(result, dict) and result.get("error")):
+            cache.set(key_hash, result)
+        return result
+
+    wrapper.cache = cache
     return wrapper
 
 
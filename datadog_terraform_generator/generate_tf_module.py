@@ -1,8 +1,7 @@
 import os
 import sys
 from os.path import join, isdir, isfile, dirname, abspath
-
-from urllib.parse import urlencode
+from typing import Iterable, Iterator
 
 from datadog_terraform_generator.api import DdApi
 from datadog_terraform_generator.config_management import get_config_by_name
@@ -21,11 +20,28 @@ from datadog_terraform_generator.gen_utils import (
     canonicalize_tf_file_name,
     render_from_template,
 )
+from datadog_terraform_generator.monitors import search_monitors
+from datadog_terraform_generator.pagination import (
+    DEFAULT_CONCURRENCY,
+    iter_parallel_pages,
+)
 from datadog_terraform_generator.terraform_calls import terraform_import, terraform_init
 
 
 IMPORT_SUGGESTIONS_FILE_NAME = "terraform_import_suggestions.txt"
 
+# fields generate_generic_monitor needs. The search endpoint doesn't return message
+# and options, so search results are always fetched by id.
+REQUIRED_MONITOR_FIELDS = (
+    "id",
+    "name",
+    "type",
+    "query",
+    "message",
+    "options",
+    "priority",
+)
+
 
 def write_module_file(module_path, file_name, contents, replacements):
     replaced_contents = fill_template(contents, replacements)
@@ -54,21 +70,48 @@ def generate_module(module_path, service_name, min_provider_version):
     write_module_file(module_path, "main.tf", "\n", {})
 
 
-def generate_modules_from_query(args, service_name, param_overrides):
-    tf_imports = []
-    filter_strings = set([])
-    config = get_config_by_name(args.config_name)
-    dd_api = DdApi.from_config(config)
-    params = {"query": args.from_query}
-    data = dd_api.request(f"api/v1/monitor/search?{urlencode(params)}")
-    for monitor in data["monitors"]:
+def monitor_is_complete(monitor: dict) -> bool:
+    return all(field in monitor for field in REQUIRED_MONITOR_FIELDS)
+
+
+def supported_monitors(monitors: Iterable[dict]) -> Iterator[dict]:
+    for monitor in monitors:
         if not monitor_supported(monitor):
             print(
                 f"unsupported monitor type '{monitor['type']}' in monitor '{monitor['name']}'"
             )
             continue
+        yield monitor
+
 
-        monitor = get_monitor_by_id(dd_api, monitor["id"])
+def hydrate_monitors(
+    dd_api: DdApi, monitors: Iterable[dict], concurrency=DEFAULT_CONCURRENCY
+) -> Iterator[dict]:
+    """
+    Streams the full definitions of the given monitors in order. Monitors that lack
+    fields (all search results) are fetched by id, in parallel. Monitors that
+    already are full definitions are passed on as they are.
+    """
+
+    def hydrate(monitor):
+        if monitor_is_complete(monitor):
+            return monitor
+        return get_monitor_by_id(dd_api, monitor["id"])
+
+    return iter_parallel_pages(hydrate, monitors, concurrency=concurrency)
+
+
+def generate_modules_from_query(args, service_name, param_overrides):
+    tf_imports = []
+    filter_strings = set([])
+    config = get_config_by_name(args.config_name)
+    dd_api = DdApi.from_config(config, concurrency=args.concurrency)
+    monitors = hydrate_monitors(
+        dd_api,
+        supported_monitors(search_monitors(dd_api, args.from_query)),
+        concurrency=args.concurrency,
+    )
+    for monitor in monitors:
         monitor_vals, module_name, filter_str = generate_generic_monitor(
             output_dir=args.module_path, data=monitor, param_overrides=param_overrides
         )
@@ -222,6 +265,12 @@ def add_sub_parser(subparsers):
         help="provide a query string like you would in the datadog UI to search for monitors. All results will be added in the new module",
         default=None,
     )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of monitors fetched at the same time when using --from_query",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+    )
     defaults = load_search_replace_defaults()
     for ky, vl in defaults.items():
         parser.add_argument(f"--{ky}")
@@ -1,107 +1,148 @@
+import csv
 import json
+import re
+import sys
 
-import math
-from fnmatch import fnmatch
+from fnmatch import translate
 
 from datadog_terraform_generator.api import DdApi
 from datadog_terraform_generator.config_management import get_config_by_name
+from datadog_terraform_generator.external_sort import (
+    DEFAULT_MAX_IN_MEMORY,
+    external_sort,
+)
+from datadog_terraform_generator.host_inventory import (
+    HostRecord,
+    iter_host_pages,
+    refresh_host_snapshot,
+)
+from datadog_terraform_generator.host_snapshot import (
+    build_snapshot,
+    load_snapshot,
+    print_diff,
+    save_snapshot,
+)
+from datadog_terraform_generator.tag_matcher import compile_tags_pattern, index_tags
 
 
 def get_host_list(
-    dd_api: DdApi, host_name_pattern=None, tags_pattern=None, show_agent_version=False
+    dd_api: DdApi,
+    host_name_pattern=None,
+    tags_pattern=None,
+    show_agent_version=False,
+    use_snapshot=False,
+    full_refresh=False,
+    include_metadata=True,
 ):
-    if host_name_pattern:
-        host_name_pattern = host_name_pattern.lower()
-    if tags_pattern:
-        tags_pattern = tags_pattern.lower()
-
-    page_size = 1000
-    hosts = dd_api.request(f"api/v1/hosts?count={page_size}")
-    number_subsequent_requests = math.ceil(
-        (hosts["total_matching"] - hosts["total_returned"]) / page_size
+    """
+    Yields a HostRecord per matching host. Leave out the metadata when the agent
+    version and ip aren't needed, it's the bulk of the hosts api response.
+    """
+    name_matcher = (
+        re.compile(translate(host_name_pattern.lower())) if host_name_pattern else None
     )
-    yield from filter_hosts(host_name_pattern, hosts, tags_pattern)
-    for call_nr in range(number_subsequent_requests):
-        start = (call_nr + 1) * page_size
-        hosts = dd_api.request(f"api/v1/hosts?count={page_size}&start={start}")
-        yield from filter_hosts(host_name_pattern, hosts, tags_pattern)
-
-
-def tags_match(tags, tags_pattern):
-    for matchable_pattern in tags_pattern.split(","):
-        pattern_key, pattern_value = matchable_pattern.split(":")
-        for tag in tags:
-            if ":" in tag:
-                tag_key, tag_value = tag.split(":", maxsplit=1)
-                if tag_key == pattern_key and fnmatch(tag_value, pattern_value):
-                    return True
-    return False
-
-
-def filter_hosts(host_name_pattern, hosts, tags_pattern):
+    tags_matcher = compile_tags_pattern(tags_pattern.lower()) if tags_pattern else None
+
+    if use_snapshot:
+        pages = [
+            {
+                "host_list": refresh_host_snapshot(
+                    dd_api, full_refresh=full_refresh, include_metadata=include_metadata
+                )
+            }
+        ]
+    else:
+        pages = iter_host_pages(dd_api, include_metadata=include_metadata)
+    for hosts in pages:
+        yield from filter_hosts(name_matcher, hosts, tags_matcher)
+
+
+def filter_hosts(name_matcher, hosts, tags_matcher):
     for host in hosts["host_list"]:
-        name = host["name"].lower()
-        if host_name_pattern and not fnmatch(name, host_name_pattern):
+        if name_matcher and not name_matcher.match(host["name"].lower()):
             continue
-
-        tags = get_tags_from_host(host)
-        if tags_pattern and not tags_match(tags, tags_pattern):
+        record = HostRecord(host)
+        if tags_matcher and not tags_matcher.matches(index_tags(record.tags)):
             continue
-        yield host
+        yield record
 
 
-def get_ip_from_gohai(gohai):
-    if gohai and gohai.get("network"):
-        return gohai["network"].get("ipaddress", "")
+OUTPUT_FORMATS = ("text", "jsonl", "csv")
 
 
-def print_hosts(hosts, show_agent_version=False):
+def host_sort_key(host):
+    return host.env, host.name
+
+
+def print_hosts(
+    hosts,
+    show_agent_version=False,
+    show_ip=False,
+    output_format="text",
+    sort=True,
+    max_in_memory=DEFAULT_MAX_IN_MEMORY,
+):
+    """
+    Prints the hosts as they come in, unless they need sorting. Sorting holds at
+    most max_in_memory hosts in memory, the rest is spilled to temp files.
+    """
+    if sort:
+        hosts = external_sort(hosts, key=host_sort_key, max_in_memory=max_in_memory)
+    columns = ["name", "env", "tags"]
+    if show_ip:
+        columns.append("ip")
+    if show_agent_version:
+        columns.append("agent_version")
+    if output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
     cnt = 0
-    for host in sorted(hosts, key=lambda h: (get_env_from_host(h), h["name"])):
-        cnt += 1
-        tags = get_tags_from_host(host)
-        agent_version = (
-            host["meta"].get("agent_version", "") if show_agent_version else ""
-        )
-        if show_agent_version and not agent_version:
+    for host in hosts:
+        if show_agent_version and not host.agent_version:
             continue
-        if "gohai" in host["meta"]:
-            gohai = json.loads(host["meta"]["gohai"])
-            ip_address = get_ip_from_gohai(gohai)
-            print(host["name"], tags, ip_address, agent_version)
+        cnt += 1
+        if output_format == "jsonl":
+            print(json.dumps({column: getattr(host, column) for column in columns}))
+        elif output_format == "csv":
+            writer.writerow(
+                [
+                    " ".join(host.tags) if column == "tags" else getattr(host, column)
+                    for column in columns
+                ]
+            )
         else:
-            print(host["name"], tags, agent_version)
-    print(f"Found {cnt} hosts")
-
-
-def get_env_from_host(host):
-    return get_env(get_tags_from_host(host))
-
-
-def get_env(tags):
-    for tag in tags:
-        if tag.startswith("env:"):
-            return tag[4:]
-    return ""
-
-
-def get_tags_from_host(host):
-    all_tags = []
-    tbs = host["tags_by_source"]
-    for ky, tags in tbs.items():
-        all_tags.extend(tags)
-    return list(sorted(set(all_tags)))
+            print(*[getattr(host, column) for column in columns if column != "env"])
+    if output_format == "text":
+        print(f"Found {cnt} hosts")
 
 
 def main(args):
     config = get_config_by_name(args.config_name)
+    snapshot_mode = args.diff or args.save_snapshot
+    hosts = get_host_list(
+        dd_api=DdApi.from_config(config),
+        host_name_pattern=args.host_name_pattern,
+        tags_pattern=args.tags_pattern,
+        use_snapshot=args.snapshot or args.full_refresh,
+        full_refresh=args.full_refresh,
+        # snapshots hold the agent version
+        include_metadata=args.show_agent_version or args.show_ip or snapshot_mode,
+    )
+    if snapshot_mode:
+        snapshot = build_snapshot(hosts)
+        if args.diff:
+            print_diff(load_snapshot(args.diff), snapshot)
+        if args.save_snapshot:
+            save_snapshot(args.save_snapshot, snapshot)
+        return
     print_hosts(
-        get_host_list(
-            dd_api=DdApi.from_config(config),
-            host_name_pattern=args.host_name_pattern,
-            tags_pattern=args.tags_pattern,
-        ),
+        hosts,
         show_agent_version=args.show_agent_version,
+        show_ip=args.show_ip,
+        output_format=args.output_format,
+        # text output is sorted by default, jsonl and csv are streamed
+        sort=args.output_format == "text" if args.sort is None else args.sort,
+        max_in_memory=args.max_in_memory,
     )
 
 
@@ -121,6 +162,9 @@ def add_sub_parser(subparsers):
         "--tags_pattern",
         help="""Give the pattern with which the host tags needs to match
              multiple values can be supplied like: "ky:vl,k2:someth*"
+             a comma or OR matches either side, AND (or a space) both sides,
+             NOT negates, group with parentheses:
+             "(env:prd,env:acc) AND NOT role:db*"
              Patterns are Unix shell style:
              *       matches everything
              ?       matches any single character
@@ -129,4 +173,47 @@ def add_sub_parser(subparsers):
              """,
     )
     parser.add_argument("--show_agent_version", action="store_true")
+    parser.add_argument(
+        "--show_ip", help="Show the ip address of the hosts", action="store_true"
+    )
+    parser.add_argument(
+        "--snapshot",
+        help="Keep the hosts in a snapshot on disk, "
+        "later runs only download the hosts that reported since the previous run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--full_refresh",
+        help="Download all hosts into the snapshot again",
+        action="store_true",
+    )
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="text")
+    parser.add_argument(
+        "--sort",
+        help="Sort on env and name, default for the text output format",
+        action="store_true",
+        default=None,
+    )
+    parser.add_argument(
+        "--no_sort",
+        help="Print the hosts as they come in",
+        action="store_false",
+        dest="sort",
+    )
+    parser.add_argument(
+        "--max_in_memory",
+        help="Hosts kept in memory while sorting, the rest is spilled to disk",
+        type=int,
+        default=DEFAULT_MAX_IN_MEMORY,
+    )
+    parser.add_argument(
+        "--save_snapshot",
+        help="Write the name, env, tags hash and agent version of the hosts to "
+        "this file, to --diff against later",
+    )
+    parser.add_argument(
+        "--diff",
+        help="Show the hosts that were added, removed or changed since this "
+        "--save_snapshot file",
+    )
     parser.set_defaults(func=main)
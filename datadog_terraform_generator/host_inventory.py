@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from os.path import join
+from typing import Iterator, List, Optional
+
+from datadog_terraform_generator.api import DdApi
+from datadog_terraform_generator.cache import CACHE_DIR
+from datadog_terraform_generator.pagination import iter_counted_pages
+
+SNAPSHOT_VERSION = 1
+PAGE_SIZE = 1000
+# hosts that didn't report for this long are dropped from the snapshot
+STALE_SECONDS = 3 * 60 * 60
+# a host can show up in the api a bit later than its last reported time
+REFRESH_OVERLAP_SECONDS = 10 * 60
+# after this long the snapshot is downloaded in full again
+FULL_REFRESH_SECONDS = 24 * 60 * 60
+
+
+def get_tags_from_host(host):
+    all_tags = []
+    tbs = host["tags_by_source"]
+    for ky, tags in tbs.items():
+        all_tags.extend(tags)
+    return list(sorted(set(all_tags)))
+
+
+def get_env(tags):
+    for tag in tags:
+        if tag.startswith("env:"):
+            return tag[4:]
+    return ""
+
+
+def get_ip_from_gohai(gohai):
+    if gohai and gohai.get("network"):
+        return gohai["network"].get("ipaddress", "")
+
+
+class HostRecord:
+    """
+    The parts of a host we show, derived once per host. gohai is a JSON string of
+    several KB per host, it's only decoded when the ip is asked for.
+    """
+
+    __slots__ = ("name", "tags", "env", "agent_version", "gohai", "_ip")
+
+    def __init__(self, host: dict):
+        self.name = host["name"]
+        self.tags = get_tags_from_host(host)
+        self.env = get_env(self.tags)
+        meta = host.get("meta") or {}
+        self.agent_version = meta.get("agent_version") or ""
+        self.gohai = meta.get("gohai")
+        self._ip = None
+
+    @property
+    def ip(self) -> str:
+        if self._ip is None:
+            gohai = json.loads(self.gohai) if self.gohai else None
+            self._ip = get_ip_from_gohai(gohai) or ""
+            # the ip is all we need from it
+            self.gohai = None
+        return self._ip
+
+
+def iter_host_pages(
+    dd_api: DdApi,
+    from_timestamp: Optional[int] = None,
+    page_size=PAGE_SIZE,
+    include_metadata=True,
+) -> Iterator[dict]:
+    """
+    Yields the pages of the hosts api, the first page tells us how many hosts
+    there are, the remaining pages are fetched in parallel.
+    from_timestamp only returns the hosts that reported since then.
+    Without metadata (agent version, gohai) the pages are a fraction of the size.
+    """
+    params = f"count={page_size}&include_muted_hosts_data=false"
+    if from_timestamp:
+        params += f"&from={from_timestamp}"
+    if not include_metadata:
+        params += "&include_hosts_metadata=false"
+
+    def fetch_page(start):
+        return dd_api.request(f"api/v1/hosts?{params}&start={start}")
+
+    def remaining_starts(first_page):
+        return range(
+            first_page["total_returned"], first_page["total_matching"], page_size
+        )
+
+    return iter_counted_pages(fetch_page, remaining_starts, first_token=0)
+
+
+def get_snapshot_path(dd_api: DdApi) -> str:
+    account = hashlib.sha256(f"{dd_api.api_host}{dd_api.api_key}".encode()).hexdigest()
+    return join(CACHE_DIR, f"hosts-{account[:16]}.json.gz")
+
+
+def load_snapshot(path: str) -> dict:
+    if not os.path.isfile(path):
+        return {}
+    with gzip.open(path, "rt") as fl:
+        snapshot = json.load(fl)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return {}
+    return snapshot
+
+
+def store_snapshot(path: str, snapshot: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt") as fl:
+        json.dump(snapshot, fl)
+    os.replace(tmp_path, path)
+
+
+def host_key(host: dict) -> str:
+    return str(host.get("id") or host["name"])
+
+
+def refresh_host_snapshot(
+    dd_api: DdApi, path: Optional[str] = None, full_refresh=False, include_metadata=True
+) -> List[dict]:
+    """
+    Returns all hosts from the on disk snapshot after bringing it up to date.
+    Only the hosts that reported since the previous refresh are downloaded,
+    hosts that stopped reporting are dropped once they're stale.
+    A snapshot without metadata is downloaded again when metadata is needed.
+    """
+    path = path or get_snapshot_path(dd_api)
+    snapshot = load_snapshot(path)
+    now = int(time.time())
+    refreshed_at = snapshot.get("refreshed_at", 0)
+    if (
+        full_refresh
+        or now - refreshed_at > FULL_REFRESH_SECONDS
+        or (include_metadata and not snapshot.get("include_metadata"))
+    ):
+        hosts = {}
+        from_timestamp = None
+    else:
+        hosts = snapshot["hosts"]
+        from_timestamp = refreshed_at - REFRESH_OVERLAP_SECONDS
+        # keep the snapshot consistent, all hosts have metadata or none do
+        include_metadata = snapshot["include_metadata"]
+
+    updated = set()
+    for page in iter_host_pages(
+        dd_api, from_timestamp=from_timestamp, include_metadata=include_metadata
+    ):
+        for host in page["host_list"]:
+            key = host_key(host)
+            hosts[key] = host
+            updated.add(key)
+
+    if from_timestamp is not None:
+        stale_before = now - STALE_SECONDS
+        hosts = {
+            key: host
+            for key, host in hosts.items()
+            if key in updated or host.get("last_reported_time", now) >= stale_before
+        }
+    store_snapshot(
+        path,
+        {
+            "version": SNAPSHOT_VERSION,
+            "refreshed_at": now,
+            "include_metadata": include_metadata,
+            "hosts": hosts,
+        },
+    )
+    return list(hosts.values())
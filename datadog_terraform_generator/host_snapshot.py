@@ -0,0 +1,110 @@
+import hashlib
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+SNAPSHOT_HEADER = "#ddtfgen host snapshot v1"
+
+
+class HostEntry(NamedTuple):
+    name: str
+    env: str
+    tags_hash: str
+    agent_version: str
+
+
+def tags_hash(tags: Iterable[str]) -> str:
+    return hashlib.blake2b(
+        "\n".join(sorted(tags)).encode("utf-8"), digest_size=8
+    ).hexdigest()
+
+
+def sorted_entries(entries: Iterable[HostEntry]) -> List[HostEntry]:
+    """
+    One entry per host name, sorted on name
+    """
+    by_name = {entry.name: entry for entry in entries}
+    return [by_name[name] for name in sorted(by_name)]
+
+
+def build_snapshot(hosts) -> List[HostEntry]:
+    """
+    Snapshot of HostRecords
+    """
+    return sorted_entries(
+        HostEntry(host.name, host.env, tags_hash(host.tags), host.agent_version)
+        for host in hosts
+    )
+
+
+def save_snapshot(path: str, entries: List[HostEntry]):
+    with open(path, "w") as fl:
+        fl.write(SNAPSHOT_HEADER + "\n")
+        for entry in entries:
+            fl.write("\t".join(entry) + "\n")
+
+
+def load_snapshot(path: str) -> List[HostEntry]:
+    with open(path, "r") as fl:
+        header = fl.readline().rstrip("\n")
+        if header != SNAPSHOT_HEADER:
+            raise ValueError(f"{path} is not a host snapshot")
+        entries = [HostEntry(*line.rstrip("\n").split("\t")) for line in fl]
+    # snapshots are written sorted, but someone may have edited one
+    if any(a.name >= b.name for a, b in zip(entries, entries[1:])):
+        entries = sorted_entries(entries)
+    return entries
+
+
+def diff_snapshots(
+    old: List[HostEntry], new: List[HostEntry]
+) -> Iterator[Tuple[str, HostEntry, HostEntry]]:
+    """
+    Merge join of two snapshots sorted on name, yields ("+", None, new_entry) for
+    added hosts, ("-", old_entry, None) for removed hosts and
+    ("~", old_entry, new_entry) for hosts of which env, tags or agent version
+    changed, in name order.
+    """
+    old_idx = new_idx = 0
+    while old_idx < len(old) and new_idx < len(new):
+        old_entry, new_entry = old[old_idx], new[new_idx]
+        if old_entry.name < new_entry.name:
+            yield "-", old_entry, None
+            old_idx += 1
+        elif old_entry.name > new_entry.name:
+            yield "+", None, new_entry
+            new_idx += 1
+        else:
+            if old_entry != new_entry:
+                yield "~", old_entry, new_entry
+            old_idx += 1
+            new_idx += 1
+    for old_entry in old[old_idx:]:
+        yield "-", old_entry, None
+    for new_entry in new[new_idx:]:
+        yield "+", None, new_entry
+
+
+def describe_change(old_entry: HostEntry, new_entry: HostEntry) -> str:
+    changes = []
+    if old_entry.env != new_entry.env:
+        changes.append(f"env {old_entry.env or '-'} -> {new_entry.env or '-'}")
+    if old_entry.tags_hash != new_entry.tags_hash:
+        changes.append("tags changed")
+    if old_entry.agent_version != new_entry.agent_version:
+        changes.append(
+            f"agent {old_entry.agent_version or '-'} -> {new_entry.agent_version or '-'}"
+        )
+    return ", ".join(changes)
+
+
+def print_diff(old: List[HostEntry], new: List[HostEntry]):
+    counts = {"+": 0, "-": 0, "~": 0}
+    for change, old_entry, new_entry in diff_snapshots(old, new):
+        counts[change] += 1
+        if change == "~":
+            print("~", new_entry.name, describe_change(old_entry, new_entry))
+        else:
+            print(change, (new_entry or old_entry).name)
+    print(
+        f"{counts['+']} added, {counts['-']} removed, {counts['~']} changed, "
+        f"{len(new)} hosts"
+    )
@@ -1,10 +1,16 @@
-import time
-from collections import defaultdict
-from typing import Optional
+import csv
+import json
+import os
+from typing import Dict, Iterator, Optional, Tuple
 
 from datadog_terraform_generator.api import DdApi
 from datadog_terraform_generator.config_management import get_config_by_name
 from datadog_terraform_generator.gen_utils import file_cached
+from datadog_terraform_generator.metric_trie import MetricTrie
+from datadog_terraform_generator.pagination import iter_parallel_pages
+
+DEFAULT_OUTPUT_PATH = "metric_volume.csv"
+DEFAULT_SCAN_CONCURRENCY = 4
 
 
 def attribs_to_volume(attribs):
@@ -16,75 +22,179 @@ def attribs_to_volume(attribs):
     )
 
 
-def get_metric_list(
+def get_checkpoint_path(output_path):
+    return f"{output_path}.checkpoint"
+
+
+def load_checkpoint(checkpoint_path) -> Dict[str, Optional[int]]:
+    """
+    The checkpoint is a json line per finished metric, volume is null when the
+    metric has no volume. A partially written last line (crash) is ignored.
+    """
+    done = {}
+    if not os.path.isfile(checkpoint_path):
+        return done
+    with open(checkpoint_path, "r") as fl:
+        for line in fl:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[item["metric"]] = item["volume"]
+    return done
+
+
+def scan_metric_volumes(
     dd_api: DdApi,
-    metric_name_prefix_filter: Optional[str],
-    sleep_time=3.4,
-    split_char=".",
-):
+    metric_names,
+    checkpoint_path,
+    concurrency=DEFAULT_SCAN_CONCURRENCY,
+) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Yields (metric_name, volume) for all metric names. Metrics that are in the
+    checkpoint are yielded from there, the others are requested concurrently (the
+    DdApi rate limiter keeps this within the rate budget) and appended to the
+    checkpoint as soon as they are in, so an interrupted scan resumes where it
+    stopped. Checkpointed metrics that aren't in metric_names are skipped. Failed
+    lookups are yielded with the exception as volume and are not checkpointed.
+    """
+
     def get_metric_volume_attribs(metric_name):
         print(metric_name)
-        # Default rate for this is 3 requests in 10 secs
+        # Default rate for this is 3 requests in 10 secs, DdApi paces the calls
         # https://docs.datadoghq.com/api/latest/rate-limits/
-        time.sleep(sleep_time)
         res = dd_api.request(f"api/v2/metrics/{metric_name}/volumes")
         return res["data"]["attributes"]
-        # return "skip"
 
     get_metric_volume = file_cached(
         func=get_metric_volume_attribs, max_cache_age_seconds=3600 * 24 * 1
     )
 
-    prefix_filter_len = (
-        len(metric_name_prefix_filter) if metric_name_prefix_filter else 0
-    )
-    volumes = {}
-    prefixes = defaultdict(int)
-    total_volume = 0
-    try:
-        metrics = dd_api.request("api/v2/metrics")
-        for metric_def in metrics["data"]:
-            metric_name = metric_def["id"]
-            if metric_name_prefix_filter and not metric_name.startswith(
-                metric_name_prefix_filter
-            ):
-                continue
-            attribs = get_metric_volume(metric_name)
-            if attribs == "skip":
+    def fetch_volume(metric_name):
+        try:
+            return metric_name, attribs_to_volume(get_metric_volume(metric_name))
+        except Exception as ex:
+            print(metric_name, ex)
+            return metric_name, ex
+
+    done = load_checkpoint(checkpoint_path)
+    todo = []
+    # the checkpoint may hold metrics of an earlier scan with another prefix
+    for metric_name in metric_names:
+        if metric_name in done:
+            yield metric_name, done[metric_name]
+        else:
+            todo.append(metric_name)
+
+    with open(checkpoint_path, "a") as checkpoint_fl:
+        for metric_name, volume in iter_parallel_pages(
+            fetch_volume, todo, concurrency=concurrency
+        ):
+            if not isinstance(volume, Exception):
+                checkpoint_fl.write(
+                    json.dumps({"metric": metric_name, "volume": volume}) + "\n"
+                )
+                checkpoint_fl.flush()
+            yield metric_name, volume
+
+
+def get_metric_names(dd_api: DdApi, metric_name_prefix_filter: Optional[str]):
+    metrics = dd_api.request("api/v2/metrics")
+    for metric_def in metrics["data"]:
+        metric_name = metric_def["id"]
+        if metric_name_prefix_filter and not metric_name.startswith(
+            metric_name_prefix_filter
+        ):
+            continue
+        yield metric_name
+
+
+def print_rollup(trie: MetricTrie, prefix: str, depth=1, top=None):
+    """
+    Prints the volume percentage per subtree, `depth` segments below the prefix.
+    The trie only holds metrics matching the prefix, so we can count the depth
+    from the root, that also works for prefixes that end halfway a segment.
+    """
+    prefix = prefix.strip(trie.split_char)
+    prefix_depth = len(prefix.split(trie.split_char)) if prefix else 0
+    if top:
+        rollup = trie.top(top, prefix_depth + depth)
+    else:
+        rollup = sorted(
+            trie.rollup(prefix_depth + depth), key=lambda item: item[1], reverse=True
+        )
+    for name, volume in rollup:
+        print(name, str(volume / trie.total * 100)[:5], "%")
+
+
+def load_metric_volumes_csv(path) -> Iterator[Tuple[str, int]]:
+    with open(path, "r") as fl:
+        for metric_name, volume in csv.reader(fl):
+            yield metric_name, int(volume)
+
+
+def get_metric_list(
+    dd_api: DdApi,
+    metric_name_prefix_filter: Optional[str],
+    split_char=".",
+    output_path=DEFAULT_OUTPUT_PATH,
+    concurrency=DEFAULT_SCAN_CONCURRENCY,
+    restart=False,
+) -> MetricTrie:
+    metric_name_prefix_filter = metric_name_prefix_filter or ""
+    checkpoint_path = get_checkpoint_path(output_path)
+    if restart and os.path.isfile(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    trie = MetricTrie(split_char=split_char)
+    failed = 0
+    with open(output_path, "w") as fl:
+        for metric_name, volume in scan_metric_volumes(
+            dd_api=dd_api,
+            metric_names=get_metric_names(dd_api, metric_name_prefix_filter),
+            checkpoint_path=checkpoint_path,
+            concurrency=concurrency,
+        ):
+            if isinstance(volume, Exception):
+                failed += 1
                 continue
-            volume = attribs_to_volume(attribs)
             if volume is None:
                 continue
-            volumes[metric_name] = volume
-            parts = metric_name[prefix_filter_len:].lstrip(split_char).split(split_char)
-            prefix = parts[0]
-            prefixes[prefix] += volume
-            total_volume += volume
-    except Exception as ex:
-        print(ex)
-
-    with open("metric_volume.csv", "w") as fl:
-        for key in sorted(volumes, key=lambda k: volumes[k]):
-            if metric_name_prefix_filter and not key.startswith(
-                metric_name_prefix_filter
-            ):
-                continue
-            print(f"{key},{volumes[key]}", file=fl)
-
-    for prefix, volume in prefixes.items():
-        print(
-            metric_name_prefix_filter + prefix,
-            str(volume / total_volume * 100)[:5],
-            "%",
-        )
+            print(f"{metric_name},{volume}", file=fl, flush=True)
+            trie.insert(metric_name, volume)
+    if failed:
+        print(f"{failed} metrics failed, run again to retry those")
+    else:
+        # the scan completed, a next run should start fresh
+        os.remove(checkpoint_path)
+    return trie
 
 
 def main(args):
-    config = get_config_by_name(args.config_name)
-    get_metric_list(
-        dd_api=DdApi.from_config(config),
-        metric_name_prefix_filter=getattr(args, "prefix", ""),
-    )
+    prefix = getattr(args, "prefix", None) or ""
+    from_csv = getattr(args, "from_csv", None)
+    if from_csv:
+        trie = MetricTrie()
+        for metric_name, volume in load_metric_volumes_csv(from_csv):
+            if metric_name.startswith(prefix):
+                trie.insert(metric_name, volume)
+    else:
+        config = get_config_by_name(args.config_name)
+        concurrency = getattr(args, "concurrency", DEFAULT_SCAN_CONCURRENCY)
+        trie = get_metric_list(
+            dd_api=DdApi.from_config(config, concurrency=concurrency),
+            metric_name_prefix_filter=prefix,
+            output_path=getattr(args, "output", DEFAULT_OUTPUT_PATH),
+            concurrency=concurrency,
+            restart=getattr(args, "restart", False),
+        )
+    if trie.total:
+        print_rollup(
+            trie,
+            prefix,
+            depth=getattr(args, "depth", 1),
+            top=getattr(args, "top", None),
+        )
 
 
 def add_sub_parser(subparsers):
@@ -92,6 +202,33 @@ def add_sub_parser(subparsers):
     parser.add_argument(
         "--prefix", help="supply a prefix, only get the metric usage for that prefix"
     )
+    parser.add_argument(
+        "--output", help="Filename to write to", default=DEFAULT_OUTPUT_PATH
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of volume lookups at the same time",
+        type=int,
+        default=DEFAULT_SCAN_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--depth",
+        help="Number of namespace segments below the prefix to roll up the volume to",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--top", help="Only show the N heaviest namespaces", type=int, default=None
+    )
+    parser.add_argument(
+        "--from_csv",
+        help="Don't scan, roll up the volumes of a csv written by an earlier scan",
+    )
+    parser.add_argument(
+        "--restart",
+        help="Ignore the checkpoint of a previous (interrupted) scan and start over",
+        action="store_true",
+    )
     parser.set_defaults(func=main)
 
 
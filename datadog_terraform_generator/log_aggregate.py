@@ -0,0 +1,165 @@
+import csv
+import sys
+from typing import Iterator, List, Optional
+
+from arrow import Arrow
+
+from datadog_terraform_generator.api import DdApi
+from datadog_terraform_generator.config_management import get_config_by_name
+from datadog_terraform_generator.pagination import iter_items, iter_pages
+from datadog_terraform_generator.query import interpret_time
+
+AGGREGATIONS = (
+    "count",
+    "cardinality",
+    "sum",
+    "avg",
+    "min",
+    "max",
+    "median",
+    "pc75",
+    "pc90",
+    "pc95",
+    "pc98",
+    "pc99",
+)
+COMPUTE_KEY = "c0"
+DEFAULT_GROUP_LIMIT = 1000
+
+
+def aggregate_logs(
+    dd_api: DdApi,
+    _from: Arrow,
+    to: Arrow,
+    indexes: List[str],
+    query: str,
+    group_by: List[str],
+    aggregation="count",
+    metric: Optional[str] = None,
+    interval: Optional[str] = None,
+    group_limit=DEFAULT_GROUP_LIMIT,
+) -> Iterator[dict]:
+    """
+    Lets Datadog do the counting, yields the buckets of the log analytics aggregate
+    endpoint. Every bucket holds the group by values ("by") and the computed value,
+    or a list of {time, value} points when an interval is given.
+    """
+    compute = {"aggregation": aggregation, "type": "total"}
+    sort = {"aggregation": aggregation, "order": "desc", "type": "measure"}
+    if metric:
+        compute["metric"] = metric
+        sort["metric"] = metric
+    if interval:
+        compute["type"] = "timeseries"
+        compute["interval"] = interval
+    params = {
+        "compute": [compute],
+        "filter": {
+            "from": _from.isoformat(),
+            "to": to.isoformat(),
+            "indexes": indexes,
+            "query": query,
+        },
+        "group_by": [
+            {
+                "facet": facet,
+                "limit": group_limit,
+                "sort": sort,
+            }
+            for facet in group_by
+        ],
+    }
+
+    def fetch_page(cursor):
+        if cursor:
+            params["page"] = {"cursor": cursor}
+        return dd_api.request("api/v2/logs/analytics/aggregate", data=params)
+
+    def next_cursor(resp):
+        return resp.get("meta", {}).get("page", {}).get("after")
+
+    return iter_items(
+        iter_pages(fetch_page, next_cursor),
+        lambda resp: resp.get("data", {}).get("buckets", []),
+    )
+
+
+def bucket_rows(bucket: dict, group_by: List[str]) -> Iterator[list]:
+    by = [bucket.get("by", {}).get(facet, "") for facet in group_by]
+    value = bucket.get("computes", {}).get(COMPUTE_KEY)
+    if isinstance(value, list):
+        for point in value:
+            yield by + [point.get("time"), point.get("value")]
+    else:
+        yield by + [value]
+
+
+def main(args):
+    config = get_config_by_name(args.config_name)
+    buckets = aggregate_logs(
+        dd_api=DdApi.from_config(config),
+        _from=interpret_time(getattr(args, "from")),
+        to=interpret_time(args.to),
+        indexes=args.indexes,
+        query=args.query,
+        group_by=args.group_by,
+        aggregation=args.aggregation,
+        metric=args.metric,
+        interval=args.interval,
+        group_limit=args.group_limit,
+    )
+    if args.output == "stdout":
+        fl = sys.stdout
+    else:
+        fl = open(args.output, "w")
+    writer = csv.writer(fl)
+    value_header = (
+        f"{args.aggregation}({args.metric})" if args.metric else args.aggregation
+    )
+    writer.writerow(
+        args.group_by + (["time", value_header] if args.interval else [value_header])
+    )
+    for bucket in buckets:
+        writer.writerows(bucket_rows(bucket, args.group_by))
+    if fl is not sys.stdout:
+        fl.close()
+
+
+def add_sub_parser(subparsers):
+    parser = subparsers.add_parser(
+        "aggregate_logs",
+        help="Counts (or other aggregations) per group, computed by Datadog in stead of downloading all logs",
+    )
+    parser.add_argument(
+        "--from", help="Start of the queried time period, seconds since the Unix epoch."
+    )
+    parser.add_argument(
+        "--to", help="End of the queried time period, seconds since the Unix epoch."
+    )
+    parser.add_argument("--query", help="Log search query", default="*")
+    parser.add_argument(
+        "--indexes", nargs="+", help="Log indexes to search in", default=["*"]
+    )
+    parser.add_argument(
+        "--group_by",
+        nargs="+",
+        help="Facets to group by, example: host service @http.status_code",
+        default=[],
+    )
+    parser.add_argument("--aggregation", choices=AGGREGATIONS, default="count")
+    parser.add_argument(
+        "--metric",
+        help="Measure to aggregate, required for everything but count, example: @duration",
+    )
+    parser.add_argument(
+        "--interval",
+        help="Return a timeseries with buckets of this size, example: 1m, 1h",
+    )
+    parser.add_argument(
+        "--group_limit",
+        help="Maximum number of values per group by facet",
+        type=int,
+        default=DEFAULT_GROUP_LIMIT,
+    )
+    parser.add_argument("--output", help="Filename to write to", default="stdout")
+    parser.set_defaults(func=main)
@@ -0,0 +1,170 @@
+import csv
+import heapq
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_TOP_K = 100
+# fields the stats need, fetched next to the --fields when stats are enabled
+STATS_FIELDS = ("host", "status", "message")
+# 2024-01-01T00:20
+MINUTE_LENGTH = 16
+
+TEMPLATE_PATTERNS = [
+    (
+        re.compile(
+            r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I
+        ),
+        "<uuid>",
+    ),
+    (re.compile(r"\b\d{1,3}(\.\d{1,3}){3}(:\d+)?\b"), "<ip>"),
+    (re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{16,}\b", re.I), "<hex>"),
+    (re.compile(r'"[^"]*"'), "<str>"),
+    (re.compile(r"\d+(\.\d+)?"), "<num>"),
+]
+
+
+def message_template(message: str) -> str:
+    """
+    Replaces the variable parts of a log message (ids, ips, numbers, quoted strings)
+    so messages produced by the same log statement end up as the same template.
+    """
+    template = message[:1000]
+    for pattern, replacement in TEMPLATE_PATTERNS:
+        template = pattern.sub(replacement, template)
+    return template
+
+
+class SpaceSaving:
+    """
+    Heavy hitters sketch (Metwally et al.), counts the top k keys of a stream with
+    k counters. When a new key comes in while all counters are taken, it replaces
+    the smallest counter and inherits its count, that count is the maximum error.
+    The smallest counter is found with a min heap that holds one entry per key.
+    Counts only go up, so an entry is never more than the real count, it's only
+    brought up to date once it reaches the top of the heap.
+    """
+
+    __slots__ = ("k", "counts", "errors", "heap")
+
+    def __init__(self, k=DEFAULT_TOP_K, counters: Iterable[Tuple[str, int, int]] = ()):
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        for key, count, error in counters:
+            self.counts[key] = count
+            self.errors[key] = error
+        self.heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def add(self, key: str, count=1):
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.k:
+            self.counts[key] = count
+            self.errors[key] = 0
+            heapq.heappush(self.heap, (count, key))
+        else:
+            smallest_count, smallest = self.heap[0]
+            while smallest_count != self.counts[smallest]:
+                heapq.heapreplace(self.heap, (self.counts[smallest], smallest))
+                smallest_count, smallest = self.heap[0]
+            del self.counts[smallest]
+            del self.errors[smallest]
+            self.counts[key] = smallest_count + count
+            self.errors[key] = smallest_count
+            heapq.heapreplace(self.heap, (smallest_count + count, key))
+
+    def top(self, n=None) -> List[Tuple[str, int, int]]:
+        """
+        (key, count, max_error) tuples, the real count is between count - max_error
+        and count
+        """
+        keys = sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+
+def read_csv_rows(path: str) -> List[list]:
+    """
+    Rows without the header, nothing when the file doesn't exist
+    """
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r") as fl:
+        return list(csv.reader(fl))[1:]
+
+
+class LogStats:
+    """
+    Counts exported logs per minute, host and status while they stream by.
+    The export is in timestamp order, so once a log of a next minute comes in, the
+    previous minute is complete and written out. Memory holds one minute of
+    counters and the k message templates.
+    An interrupted export resumes at the start of a minute, resume_minute. The
+    minutes from there on are dropped from the minutes file and the templates file
+    holds the counters as they were at the start of the minute the export stopped
+    in, so every log is counted once.
+    """
+
+    def __init__(
+        self,
+        minutes_path: str,
+        templates_path: str,
+        top_k=DEFAULT_TOP_K,
+        resume_minute: Optional[str] = None,
+    ):
+        self.templates_path = templates_path
+        kept_rows = []
+        counters = []
+        if resume_minute:
+            kept_rows = [
+                row for row in read_csv_rows(minutes_path) if row[0] < resume_minute
+            ]
+            counters = [
+                (template, int(count), int(error))
+                for template, count, error in read_csv_rows(templates_path)
+            ]
+        self.minutes_fl = open(minutes_path, "w")
+        self.minutes_writer = csv.writer(self.minutes_fl)
+        self.minutes_writer.writerow(["minute", "host", "status", "count"])
+        self.minutes_writer.writerows(kept_rows)
+        self.minute = None
+        self.minute_counts = Counter()
+        self.templates = SpaceSaving(top_k, counters)
+        # the templates as they were before the current minute
+        self.minute_templates = self.templates.top()
+
+    def on_log(self, item: dict):
+        log = item.get("attributes", {})
+        # 2024-01-01T00:20:49.123Z -> 2024-01-01T00:20
+        minute = log.get("timestamp", "")[:MINUTE_LENGTH]
+        if minute != self.minute:
+            self.flush_minute()
+            self.minute = minute
+            self.minute_templates = self.templates.top()
+        self.minute_counts[(log.get("host", ""), log.get("status", ""))] += 1
+        message = log.get("message")
+        if message:
+            self.templates.add(message_template(message))
+
+    def flush_minute(self):
+        for (host, status), count in sorted(self.minute_counts.items()):
+            self.minutes_writer.writerow([self.minute, host, status, count])
+        self.minute_counts.clear()
+
+    def close(self, completed=True):
+        """
+        An interrupted export leaves out the minute it stopped in, it's counted
+        again when the export resumes
+        """
+        if completed:
+            self.flush_minute()
+            counters = self.templates.top()
+        else:
+            counters = self.minute_templates
+        self.minutes_fl.close()
+        with open(self.templates_path, "w") as fl:
+            writer = csv.writer(fl)
+            writer.writerow(["template", "count", "max_error"])
+            writer.writerows(counters)
@@ -0,0 +1,193 @@
+import json
+import mmap
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+import arrow
+
+from datadog_terraform_generator.query import interpret_time
+
+INDEX_VERSION = 1
+DEFAULT_BUCKET_SECONDS = 60
+
+
+def get_index_path(ndjson_path: str) -> str:
+    return f"{ndjson_path}.idx"
+
+
+def bucket_of(timestamp: str, bucket_seconds: int) -> int:
+    return int(arrow.get(timestamp).timestamp()) // bucket_seconds
+
+
+def build_index(ndjson_path: str, bucket_seconds=DEFAULT_BUCKET_SECONDS) -> dict:
+    """
+    One pass over an ndjson export (written by `logs --output_format ndjson`).
+    Per time bucket we store the byte offset of its first line, and per host and
+    service the buckets they appear in. The export is sorted on timestamp, so a
+    time range maps to one contiguous byte range of the file.
+    """
+    buckets: List[int] = []
+    offsets: List[int] = []
+    hosts: Dict[str, set] = defaultdict(set)
+    services: Dict[str, set] = defaultdict(set)
+    offset = 0
+    with open(ndjson_path, "rb") as fl:
+        for line in fl:
+            log = json.loads(line)
+            bucket = bucket_of(log["timestamp"], bucket_seconds)
+            if not buckets or bucket != buckets[-1]:
+                buckets.append(bucket)
+                offsets.append(offset)
+            bucket_idx = len(buckets) - 1
+            if log.get("host"):
+                hosts[log["host"]].add(bucket_idx)
+            if log.get("service"):
+                services[log["service"]].add(bucket_idx)
+            offset += len(line)
+    offsets.append(offset)
+    return {
+        "version": INDEX_VERSION,
+        "size": offset,
+        "mtime": os.stat(ndjson_path).st_mtime,
+        "bucket_seconds": bucket_seconds,
+        "buckets": buckets,
+        "offsets": offsets,
+        "hosts": {host: sorted(idxs) for host, idxs in hosts.items()},
+        "services": {service: sorted(idxs) for service, idxs in services.items()},
+    }
+
+
+def load_index(ndjson_path: str, bucket_seconds=DEFAULT_BUCKET_SECONDS) -> dict:
+    """
+    Loads the sidecar index, (re)builds it when it's missing or the export changed.
+    """
+    index_path = get_index_path(ndjson_path)
+    stat = os.stat(ndjson_path)
+    if os.path.isfile(index_path):
+        with open(index_path, "r") as fl:
+            index = json.load(fl)
+        if (
+            index.get("version") == INDEX_VERSION
+            and index["size"] == stat.st_size
+            and index["mtime"] == stat.st_mtime
+            and index["bucket_seconds"] == bucket_seconds
+        ):
+            return index
+    index = build_index(ndjson_path, bucket_seconds=bucket_seconds)
+    with open(index_path, "w") as fl:
+        json.dump(index, fl)
+    return index
+
+
+def candidate_buckets(
+    index: dict,
+    _from: Optional[arrow.Arrow],
+    to: Optional[arrow.Arrow],
+    host: Optional[str],
+    service: Optional[str],
+) -> List[int]:
+    buckets = index["buckets"]
+    bucket_seconds = index["bucket_seconds"]
+    first = 0
+    last = len(buckets)
+    if _from is not None:
+        first = bisect_left(buckets, int(_from.timestamp()) // bucket_seconds)
+    if to is not None:
+        last = bisect_right(buckets, int(to.timestamp()) // bucket_seconds)
+    candidates = set(range(first, last))
+    if host is not None:
+        candidates &= set(index["hosts"].get(host, []))
+    if service is not None:
+        candidates &= set(index["services"].get(service, []))
+    return sorted(candidates)
+
+
+def search(
+    ndjson_path: str,
+    _from: Optional[arrow.Arrow] = None,
+    to: Optional[arrow.Arrow] = None,
+    host: Optional[str] = None,
+    service: Optional[str] = None,
+    bucket_seconds=DEFAULT_BUCKET_SECONDS,
+) -> Iterator[bytes]:
+    """
+    Yields the matching lines, only the buckets the index points at are read from
+    the memory mapped file.
+    """
+    index = load_index(ndjson_path, bucket_seconds=bucket_seconds)
+    buckets = candidate_buckets(index, _from, to, host, service)
+    if not buckets:
+        return
+    offsets = index["offsets"]
+    # only the first and last bucket can hold logs outside of the time range
+    edge_buckets = {buckets[0], buckets[-1]}
+    with open(ndjson_path, "rb") as fl, mmap.mmap(
+        fl.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        for bucket_idx in buckets:
+            start, end = offsets[bucket_idx], offsets[bucket_idx + 1]
+            check_time = bucket_idx in edge_buckets
+            for line in mapped[start:end].splitlines():
+                log = json.loads(line)
+                if host is not None and log.get("host") != host:
+                    continue
+                if service is not None and log.get("service") != service:
+                    continue
+                if check_time:
+                    timestamp = arrow.get(log["timestamp"])
+                    if _from is not None and timestamp < _from:
+                        continue
+                    if to is not None and timestamp > to:
+                        continue
+                yield line
+
+
+def main(args):
+    for file in args.files:
+        if file.endswith((".gz", ".zst")):
+            print(
+                f"Compressed export {file} can't be memory mapped, decompress it first",
+                file=sys.stderr,
+            )
+            sys.exit(-1)
+    _from = interpret_time(getattr(args, "from")) if getattr(args, "from") else None
+    to = interpret_time(args.to) if args.to else None
+    out = sys.stdout.buffer
+    for file in args.files:
+        for line in search(
+            file,
+            _from=_from,
+            to=to,
+            host=args.host,
+            service=args.service,
+            bucket_seconds=args.bucket_seconds,
+        ):
+            out.write(line + b"\n")
+    out.flush()
+
+
+def add_sub_parser(subparsers):
+    parser = subparsers.add_parser(
+        "search_logs",
+        help="Search an ndjson export by time range, host and service. "
+        "Builds a <file>.idx sidecar index on first use",
+    )
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="ndjson file(s) written by the logs export, rotated files in order",
+    )
+    parser.add_argument("--from", help="Start of the time range", default=None)
+    parser.add_argument("--to", help="End of the time range", default=None)
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--service", default=None)
+    parser.add_argument(
+        "--bucket_seconds",
+        help="Time resolution of the index",
+        type=int,
+        default=DEFAULT_BUCKET_SECONDS,
+    )
+    parser.set_defaults(func=main)
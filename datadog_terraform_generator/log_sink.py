@@ -0,0 +1,245 @@
+import gzip
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OUTPUT_FORMATS = ("ndjson", "json", "csv")
+COMPRESSIONS = ("none", "gzip", "zstd")
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_BATCH_SIZE = 1000
+# batches waiting for the writer thread before the exporter has to wait
+MAX_QUEUED_BATCHES = 16
+
+
+def try_get_message(log_item):
+    try:
+        return log_item["attributes"]["message"]
+    except Exception:
+        return ""
+
+
+def format_log_item(item: dict, output_format: str) -> str:
+    if output_format == "csv":
+        message = try_get_message(item).replace("\n", "\t")
+        host = item["attributes"].get("host", "")
+        timestamp = item["attributes"]["timestamp"]
+        return f"{timestamp} {host} {message}\n"
+    if output_format == "json":
+        return json.dumps(item["attributes"].get("attributes", {})) + "\n"
+    return json.dumps({"id": item.get("id"), **item["attributes"]}) + "\n"
+
+
+def get_timestamp(item: dict) -> str:
+    return item["attributes"]["timestamp"]
+
+
+def rotated_path(path: str, file_index: int) -> str:
+    """
+    logs.ndjson.gz -> logs-00001.ndjson.gz
+    """
+    if file_index == 0:
+        return path
+    directory, file_name = os.path.split(path)
+    name, dot, extensions = file_name.partition(".")
+    return os.path.join(directory, f"{name}-{file_index:05d}{dot}{extensions}")
+
+
+def get_compressor():
+    if zstandard is None:
+        raise ImportError(
+            "zstd compression needs the zstandard package: pip install zstandard"
+        )
+    return zstandard.ZstdCompressor()
+
+
+def open_output(path: str, compression: str, append: bool):
+    mode = "ab" if append else "wb"
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        # concatenated zstd frames are valid, so appending is fine
+        return get_compressor().stream_writer(open(path, mode))
+    return open(path, mode)
+
+
+def open_stdout(compression: str):
+    """
+    Closing the returned stream ends the compressed stream, stdout stays open
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb")
+    if compression == "zstd":
+        return get_compressor().stream_writer(sys.stdout.buffer, closefd=False)
+    return None
+
+
+class LogSink:
+    """
+    Buffered writer for exported logs. Items are collected in batches that are
+    formatted, compressed and written by a worker thread, so the export doesn't
+    wait for disk or compression. Files are rotated on size and/or age.
+    After every written batch a checkpoint records the last written timestamp, a
+    crashed export resumes from there in stead of starting over.
+    """
+
+    def __init__(
+        self,
+        output_path: str = "stdout",
+        output_format: str = "ndjson",
+        compression: str = "none",
+        rotate_bytes: Optional[int] = None,
+        rotate_seconds: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        checkpoint_path: Optional[str] = None,
+    ):
+        self.to_stdout = output_path == "stdout"
+        if not self.to_stdout and compression in COMPRESSION_EXTENSIONS:
+            extension = COMPRESSION_EXTENSIONS[compression]
+            if not output_path.endswith(extension):
+                output_path += extension
+        self.output_path = output_path
+        self.output_format = output_format
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = self.load_checkpoint()
+
+        self.batch: List[dict] = []
+        self.count = self.checkpoint.get("count", 0)
+        self.file_index = self.checkpoint.get("file_index", 0)
+        self.file = None
+        self.file_bytes = 0
+        self.file_opened_at = None
+        self.batches = queue.Queue(maxsize=MAX_QUEUED_BATCHES)
+        self.error = None
+        self.worker = threading.Thread(target=self.write_batches, daemon=True)
+        self.worker.start()
+
+    @property
+    def resume_timestamp(self) -> Optional[str]:
+        return self.checkpoint.get("timestamp")
+
+    def already_written(self, item: dict) -> bool:
+        """
+        Logs before the timestamp of the checkpoint were written, logs with the
+        timestamp of the checkpoint may or may not have been, the checkpoint holds
+        the ids of those that were. The timestamps of an export all have the same
+        ISO 8601 format, so they compare as strings.
+        """
+        if self.resume_timestamp is None:
+            return False
+        timestamp = get_timestamp(item)
+        if timestamp == self.resume_timestamp:
+            return item.get("id") in self.checkpoint.get("ids", set())
+        return timestamp < self.resume_timestamp
+
+    def load_checkpoint(self) -> dict:
+        if self.checkpoint_path and os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path, "r") as fl:
+                checkpoint = json.load(fl)
+            checkpoint["ids"] = set(checkpoint.get("ids", []))
+            return checkpoint
+        return {}
+
+    def store_checkpoint(self, batch: List[dict]):
+        timestamp = get_timestamp(batch[-1])
+        ids = {item.get("id") for item in batch if get_timestamp(item) == timestamp}
+        if timestamp == self.checkpoint.get("timestamp"):
+            ids |= self.checkpoint["ids"]
+        self.checkpoint = {
+            "timestamp": timestamp,
+            "ids": ids,
+            "count": self.count,
+            "file_index": self.file_index,
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as fl:
+            json.dump({**self.checkpoint, "ids": list(ids)}, fl)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def write(self, item: dict):
+        self.batch.append(item)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.error:
+            raise self.error
+        if self.batch:
+            self.batches.put(self.batch)
+            self.batch = []
+
+    def close(self, completed=True):
+        self.flush()
+        self.batches.put(None)
+        self.worker.join()
+        if self.error:
+            raise self.error
+        if completed and self.checkpoint_path and os.path.isfile(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def should_rotate(self) -> bool:
+        if self.rotate_bytes and self.file_bytes >= self.rotate_bytes:
+            return True
+        if (
+            self.rotate_seconds
+            and time.time() - self.file_opened_at >= self.rotate_seconds
+        ):
+            return True
+        return False
+
+    def get_file(self):
+        if self.to_stdout:
+            if self.compression == "none":
+                return sys.stdout.buffer
+            if self.file is None:
+                self.file = open_stdout(self.compression)
+            return self.file
+        if self.file is not None and self.should_rotate():
+            self.file.close()
+            self.file = None
+            self.file_index += 1
+        if self.file is None:
+            path = rotated_path(self.output_path, self.file_index)
+            # resuming appends to the file the crashed export was writing to
+            append = bool(self.checkpoint) and os.path.isfile(path)
+            self.file = open_output(path, self.compression, append=append)
+            self.file_bytes = 0
+            self.file_opened_at = time.time()
+        return self.file
+
+    def write_batches(self):
+        try:
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    break
+                data = "".join(
+                    format_log_item(item, self.output_format) for item in batch
+                ).encode("utf-8")
+                fl = self.get_file()
+                fl.write(data)
+                fl.flush()
+                self.file_bytes += len(data)
+                self.count += len(batch)
+                if self.checkpoint_path:
+                    self.store_checkpoint(batch)
+        except Exception as ex:
+            self.error = ex
+            # keep consuming so the exporter doesn't block on a full queue
+            while self.batches.get() is not None:
+                pass
+        finally:
+            if self.file is not None:
+                self.file.close()
@@ -1,17 +1,30 @@
-import json
-import os
-import shelve
+import queue
 import sys
-import time
-from typing import List, Optional
+import threading
+from typing import Iterator, List, Optional, Sequence, Tuple
 
+import arrow
 from arrow import Arrow
 
 from datadog_terraform_generator.api import DdApi
 from datadog_terraform_generator.config_management import get_config_by_name
-from datadog_terraform_generator.gen_utils import hash_args_kwargs, CACHE_DIR
+from datadog_terraform_generator.log_analytics import (
+    DEFAULT_TOP_K,
+    MINUTE_LENGTH,
+    STATS_FIELDS,
+    LogStats,
+)
+from datadog_terraform_generator.log_sink import COMPRESSIONS, OUTPUT_FORMATS, LogSink
+from datadog_terraform_generator.pagination import iter_pages
 from datadog_terraform_generator.query import interpret_time
 
+DEFAULT_WINDOWS = 4
+# pages a window that isn't being consumed yet may fetch ahead
+MAX_BUFFERED_PAGES_PER_WINDOW = 20
+# the export needs these for ordering and resuming, they're always kept
+REQUIRED_FIELDS = ("timestamp",)
+CSV_FIELDS = ("timestamp", "host", "message")
+
 
 def list_logs(
     dd_api: DdApi,
@@ -32,83 +45,240 @@ def list_logs(
         "sort": "timestamp",
         "page": {"limit": limit},
     }
-    cache_key = None
-    shelve_storage = None
-
+    # pages aren't cached, cursors are never reused, an interrupted export resumes
+    # from the checkpoint of its sink
     if cursor is not None:
-        params["filter"]["page"]["cursor"] = cursor
-        cache_key = hash_args_kwargs(None, params)
+        params["page"]["cursor"] = cursor
+    return dd_api.request("api/v2/logs/events/search", data=params)
 
-    if cache_key:
-        cache_path = os.path.join(CACHE_DIR, "list_logs")
-        shelve_storage = shelve.open(cache_path)
-        if cache_key in shelve_storage:
-            return shelve_storage[cache_key]
 
-    result = dd_api.request("api/v2/logs/events/search", data=params)
-    if cache_key:
-        shelve_storage[cache_key] = result
+def compile_fields(fields: Optional[Sequence[str]]) -> Optional[List[Tuple[str, ...]]]:
+    """
+    Fields are dotted paths in the log (the attributes of the event), like host or
+    attributes.http.status_code
+    """
+    if not fields:
+        return None
+    fields = list(REQUIRED_FIELDS) + [
+        fld for fld in fields if fld not in REQUIRED_FIELDS
+    ]
+    return [tuple(fld.split(".")) for fld in fields]
 
-    return result
+
+def project_log_item(item: dict, field_paths: List[Tuple[str, ...]]) -> dict:
+    source = item.get("attributes", {})
+    projected = {}
+    for path in field_paths:
+        value = source
+        for part in path:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+    return {"id": item.get("id"), "attributes": projected}
 
 
-def get_paginated_logs(
+def get_paginated_log_pages(
     dd_api: DdApi,
     _from: Arrow,
     to: Arrow,
     indexes: List[str],
     query: str,
-    # cache_name: Optional[str],
-    # start_page_token: Optional[str] = None,
-):
-    resp = list_logs(dd_api=dd_api, _from=_from, to=to, query=query, indexes=indexes)
-    yield from resp["data"]
-    while resp["meta"]["page"]["after"]:
+    field_paths: Optional[List[Tuple[str, ...]]] = None,
+) -> Iterator[dict]:
+    def fetch_page(cursor):
         resp = list_logs(
-            dd_api=dd_api, _from=_from, to=to, query=query, indexes=indexes
+            dd_api=dd_api,
+            _from=_from,
+            to=to,
+            query=query,
+            indexes=indexes,
+            cursor=cursor,
         )
-        time.sleep(4)
-        yield from resp["data"]
-    print("done")
+        if field_paths:
+            # drop everything we don't need before the page gets buffered, in a
+            # new page, resp may be shared with the cache
+            return {
+                **resp,
+                "data": [project_log_item(item, field_paths) for item in resp["data"]],
+            }
+        return resp
+
+    def next_cursor(resp):
+        return resp.get("meta", {}).get("page", {}).get("after")
+
+    return iter_pages(fetch_page, next_cursor)
 
 
-def try_get_message(log_item):
+def split_time_range(
+    _from: Arrow, to: Arrow, windows: int
+) -> List[Tuple[Arrow, Arrow]]:
+    step = (to - _from) / windows
+    bounds = [_from + step * idx for idx in range(windows)] + [to]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def put_unless_stopped(page_queue: queue.Queue, item, stop) -> bool:
+    """
+    Blocks until there's room in the queue, or until the consumer stopped
+    """
+    while not stop.is_set():
+        try:
+            page_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def produce_window_pages(pages: Iterator[dict], page_queue: queue.Queue, stop):
     try:
-        return log_item["attributes"]["message"]
-    except Exception:
-        return ""
+        for page in pages:
+            if not put_unless_stopped(page_queue, page, stop):
+                return
+        put_unless_stopped(page_queue, None, stop)
+    except Exception as ex:
+        put_unless_stopped(page_queue, ex, stop)
+    finally:
+        pages.close()
+
+
+def get_time_sliced_logs(
+    dd_api: DdApi,
+    _from: Arrow,
+    to: Arrow,
+    indexes: List[str],
+    query: str,
+    windows=DEFAULT_WINDOWS,
+    max_buffered_pages=MAX_BUFFERED_PAGES_PER_WINDOW,
+    fields: Optional[Sequence[str]] = None,
+):
+    """
+    Splits [from, to] in windows that are each paged (with their own cursor chain)
+    on their own worker. Logs are sorted by timestamp and the windows don't overlap,
+    so yielding the windows one after the other gives the logs in timestamp order.
+    The first window streams right away while the others fetch ahead.
+    When fields are given, only those are kept of every log as soon as its page
+    is decoded.
+    """
+    field_paths = compile_fields(fields)
+    stop = threading.Event()
+    page_queues = []
+    for window_from, window_to in split_time_range(_from, to, windows):
+        page_queue = queue.Queue(maxsize=max_buffered_pages)
+        pages = get_paginated_log_pages(
+            dd_api=dd_api,
+            _from=window_from,
+            to=window_to,
+            indexes=indexes,
+            query=query,
+            field_paths=field_paths,
+        )
+        threading.Thread(
+            target=produce_window_pages, args=(pages, page_queue, stop), daemon=True
+        ).start()
+        page_queues.append(page_queue)
+
+    try:
+        previous_ids = set()
+        for page_queue in page_queues:
+            last_ids = set()
+            while True:
+                page = page_queue.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                last_ids = {item.get("id") for item in page["data"]}
+                for item in page["data"]:
+                    # a log exactly on the border of two windows may be in both
+                    if item.get("id") in previous_ids:
+                        continue
+                    yield item
+            previous_ids = last_ids
+    finally:
+        stop.set()
 
 
 def main(args):
     config = get_config_by_name(args.config_name)
-    if args.output_path == "stdout":
-        fl = sys.stdout
-    else:
-        fl = open(args.output_path, "w")
-    cnt = 0
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None and args.output != "stdout":
+        checkpoint_path = f"{args.output}.checkpoint"
+    sink = LogSink(
+        output_path=args.output,
+        output_format=args.output_format,
+        compression=args.compression,
+        rotate_bytes=args.rotate_mb * 1024 * 1024 if args.rotate_mb else None,
+        rotate_seconds=args.rotate_minutes * 60 if args.rotate_minutes else None,
+        checkpoint_path=checkpoint_path,
+    )
+    _from = interpret_time(getattr(args, "from"))
+    resume_minute = None
+    if sink.resume_timestamp:
+        resume_from = arrow.get(sink.resume_timestamp)
+        if args.stats:
+            # the stats of the minute the export stopped in weren't kept, the
+            # logs of that minute are counted again, but not written again
+            resume_from = resume_from.floor("minute")
+            resume_minute = sink.resume_timestamp[:MINUTE_LENGTH]
+        _from = max(_from, resume_from)
+        print(f"Resuming from {sink.resume_timestamp}", file=sys.stderr)
 
-    for item in get_paginated_logs(
-        dd_api=DdApi.from_config(config),
-        _from=interpret_time(getattr(args, "from")),
-        to=interpret_time(args.to),
-        query=args.query,
-        indexes=args.indexes,
-    ):
-        if args.output == "csv":
-            message = try_get_message(item)
-            host = item["attributes"]["host"]
-            timestamp = item["attributes"]["timestamp"]
-            print(timestamp, host, message.replace("\n", "\t"), file=fl)
-        else:
-            try:
-                print(json.dumps(item["attributes"]["attributes"]), file=fl)
-            except Exception as ex:
-                print(ex)
-        cnt += 1
-        if args.limit is not None and args.limit > cnt:
-            return
-        if args.print_counts and cnt % 100_000 == 0:
-            print(cnt)
+    fields = args.fields
+    if not fields and args.output_format == "csv":
+        fields = CSV_FIELDS
+    fetched_fields = fields
+    export_paths = None
+    stats = None
+    if args.stats:
+        if fields:
+            # the stats need more fields than the export, the logs are fetched with
+            # both and projected once more before they're written
+            fetched_fields = list(fields) + list(STATS_FIELDS)
+            export_paths = compile_fields(fields)
+        stats_base = "logs" if args.output == "stdout" else args.output
+        stats = LogStats(
+            minutes_path=f"{stats_base}.minutes.csv",
+            templates_path=f"{stats_base}.templates.csv",
+            top_k=args.stats_top_k,
+            resume_minute=resume_minute,
+        )
+
+    cnt = 0
+    completed = False
+    try:
+        for item in get_time_sliced_logs(
+            # every window has a request in flight
+            dd_api=DdApi.from_config(config, concurrency=args.windows),
+            _from=_from,
+            to=interpret_time(args.to),
+            query=args.query,
+            indexes=args.indexes,
+            windows=args.windows,
+            fields=fetched_fields,
+        ):
+            if stats:
+                stats.on_log(item)
+            if sink.already_written(item):
+                continue
+            if export_paths:
+                item = project_log_item(item, export_paths)
+            sink.write(item)
+            cnt += 1
+            if args.limit is not None and cnt >= args.limit:
+                break
+            if args.print_counts and cnt % 100_000 == 0:
+                print(cnt, file=sys.stderr)
+        completed = True
+    finally:
+        sink.close(completed=completed)
+        if stats:
+            stats.close(completed=completed)
 
 
 def add_sub_parser(subparsers):
@@ -119,7 +289,63 @@ def add_sub_parser(subparsers):
     parser.add_argument(
         "--to", help="End of the queried time period, seconds since the Unix epoch."
     )
+    parser.add_argument("--query", help="Log search query", default="*")
+    parser.add_argument(
+        "--indexes", nargs="+", help="Log indexes to search in", default=["*"]
+    )
+    parser.add_argument(
+        "--windows",
+        help="Number of time windows that are fetched in parallel",
+        type=int,
+        default=DEFAULT_WINDOWS,
+    )
+    parser.add_argument(
+        "--fields",
+        nargs="+",
+        help="Only keep these fields of every log, example: host service attributes.http.status_code",
+        default=None,
+    )
     parser.add_argument("--output", help="Filename to write to", default="stdout")
+    parser.add_argument(
+        "--output_format",
+        help="ndjson: full log events, json: only the log attributes, csv: timestamp host message",
+        choices=OUTPUT_FORMATS,
+        default="ndjson",
+    )
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument(
+        "--rotate_mb",
+        help="Start a new file after this many MB (uncompressed)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--rotate_minutes",
+        help="Start a new file after this many minutes",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Checkpoint file to resume an interrupted export, default <output>.checkpoint",
+        default=None,
+    )
+    parser.add_argument(
+        "--limit", help="Stop after this many logs", type=int, default=None
+    )
+    parser.add_argument("--print_counts", action="store_true")
+    parser.add_argument(
+        "--stats",
+        help="Also write <output>.minutes.csv (logs per minute, host and status) and "
+        "<output>.templates.csv (most frequent message templates) of the exported logs",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stats_top_k",
+        help="Number of message templates to keep track of",
+        type=int,
+        default=DEFAULT_TOP_K,
+    )
     parser.set_defaults(func=main)
 
 
@@ -134,8 +360,15 @@ if __name__ == "__main__":
     o.to = "now"
     o.query = "source:kong"
     o.indexes = ["*"]
-    o.output = "csv"
-    o.output_path = "stdout"
+    o.windows = DEFAULT_WINDOWS
+    o.output = "stdout"
+    o.output_format = "csv"
+    o.compression = "none"
+    o.rotate_mb = None
+    o.rotate_minutes = None
+    o.checkpoint = None
+    o.fields = None
+    o.stats = False
     o.print_counts = True
     o.limit = 5
     main(o)
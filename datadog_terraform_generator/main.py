@@ -19,8 +19,12 @@ import datadog_terraform_generator.import_generated_module as import_generated_m
 import datadog_terraform_generator.downtimes as downtimes
 import datadog_terraform_generator.monitors as monitors
 import datadog_terraform_generator.list_metric_usage as list_metric_usage
+import datadog_terraform_generator.logs as logs
+import datadog_terraform_generator.log_aggregate as log_aggregate
+import datadog_terraform_generator.log_index as log_index
 import datadog_terraform_generator.module_versions as module_versions
 import datadog_terraform_generator.table as table
+import datadog_terraform_generator.cache as cache
 
 
 def main():
@@ -46,8 +50,12 @@ def main():
         downtimes.add_sub_parser(sub_parser)
         monitors.add_sub_parser(sub_parser)
         list_metric_usage.add_sub_parser(sub_parser)
+        logs.add_sub_parser(sub_parser)
+        log_aggregate.add_sub_parser(sub_parser)
+        log_index.add_sub_parser(sub_parser)
         module_versions.add_sub_parser(sub_parser)
         table.add_sub_parser(sub_parser)
+        cache.add_sub_parser(sub_parser)
 
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
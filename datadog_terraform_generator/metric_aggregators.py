@@ -0,0 +1,389 @@
+import abc
+import math
+import random
+from functools import partial
+from typing import List, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# accuracy of the percentile sketch, the rank error is about 1.7 / k
+DEFAULT_SKETCH_K = 200
+
+
+def numpy_array(values) -> bool:
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+
+def series_values(pointlist):
+    """
+    The non None values of a pointlist, a numpy array when numpy is installed
+    """
+    if numpy is not None:
+        if not pointlist:
+            return numpy.empty(0)
+        # None becomes nan
+        values = numpy.array(pointlist, dtype=float)[:, 1]
+        return values[~numpy.isnan(values)]
+    return [point[1] for point in pointlist if point[1] is not None]
+
+
+class MetricAggregator(abc.ABC):
+    """
+    Aggregates the values of a metric over time in constant memory. Aggregators
+    of the same kind can be merged, so the values can be aggregated in parts
+    (series, time chunks) and combined afterwards.
+    """
+
+    __slots__ = ()
+
+    def on_value(self, value):
+        raise NotImplementedError("on_value")
+
+    def on_values(self, values):
+        """
+        All non None values of a series, a list or a numpy array
+        """
+        for value in values:
+            self.on_value(value)
+
+    def merge(self, other):
+        """
+        Adds the state of an aggregator of the same kind that saw values that come
+        after the values of this one
+        """
+        raise NotImplementedError("merge")
+
+    def get_result(self):
+        raise NotImplementedError("get_result")
+
+
+class MaxAggregator(MetricAggregator):
+    __slots__ = ("max",)
+
+    def __init__(self):
+        self.max = -math.inf
+
+    def on_value(self, value):
+        if value > self.max:
+            self.max = value
+
+    def on_values(self, values):
+        if len(values):
+            self.on_value(float(values.max()) if numpy_array(values) else max(values))
+
+    def merge(self, other):
+        self.on_value(other.max)
+
+    def get_result(self):
+        return self.max
+
+
+class MinAggregator(MetricAggregator):
+    __slots__ = ("min",)
+
+    def __init__(self):
+        self.min = math.inf
+
+    def on_value(self, value):
+        if value < self.min:
+            self.min = value
+
+    def on_values(self, values):
+        if len(values):
+            self.on_value(float(values.min()) if numpy_array(values) else min(values))
+
+    def merge(self, other):
+        self.on_value(other.min)
+
+    def get_result(self):
+        return self.min
+
+
+class SumAggregator(MetricAggregator):
+    __slots__ = ("sum",)
+
+    def __init__(self):
+        self.sum = 0.0
+
+    def on_value(self, value):
+        self.sum += value
+
+    def on_values(self, values):
+        self.sum += float(values.sum()) if numpy_array(values) else math.fsum(values)
+
+    def merge(self, other):
+        self.sum += other.sum
+
+    def get_result(self):
+        return self.sum
+
+
+class CountAggregator(MetricAggregator):
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+    def on_value(self, value):
+        self.count += 1
+
+    def on_values(self, values):
+        self.count += len(values)
+
+    def merge(self, other):
+        self.count += other.count
+
+    def get_result(self):
+        return self.count
+
+
+class AvgAggregator(MetricAggregator):
+    __slots__ = ("sum", "count")
+
+    def __init__(self):
+        self.sum = 0.0
+        self.count = 0
+
+    def on_value(self, value):
+        self.sum += value
+        self.count += 1
+
+    def on_values(self, values):
+        self.sum += float(values.sum()) if numpy_array(values) else math.fsum(values)
+        self.count += len(values)
+
+    def merge(self, other):
+        self.sum += other.sum
+        self.count += other.count
+
+    def get_result(self):
+        if self.count:
+            return self.sum / self.count
+
+
+class StddevAggregator(MetricAggregator):
+    """
+    Population standard deviation, Welford's algorithm per value, series are
+    combined with the parallel variant (Chan et al.)
+    """
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def on_value(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def on_values(self, values):
+        if not len(values):
+            return
+        if not numpy_array(values):
+            return super().on_values(values)
+        mean = float(values.mean())
+        self.combine(len(values), mean, float(((values - mean) ** 2).sum()))
+
+    def combine(self, count, mean, m2):
+        total = self.count + count
+        if not total:
+            return
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def merge(self, other):
+        self.combine(other.count, other.mean, other.m2)
+
+    def get_result(self):
+        if self.count:
+            return math.sqrt(self.m2 / self.count)
+
+
+class LastAggregator(MetricAggregator):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def on_value(self, value):
+        self.value = value
+
+    def on_values(self, values):
+        if len(values):
+            self.value = float(values[-1])
+
+    def merge(self, other):
+        if other.value is not None:
+            self.value = other.value
+
+    def get_result(self):
+        return self.value
+
+
+class FirstAggregator(MetricAggregator):
+    __slots__ = ("value", "has_value")
+
+    def __init__(self):
+        self.value = None
+        self.has_value = False
+
+    def on_value(self, value):
+        if not self.has_value:
+            self.value = value
+            self.has_value = True
+
+    def on_values(self, values):
+        if len(values):
+            self.on_value(float(values[0]))
+
+    def merge(self, other):
+        if other.has_value:
+            self.on_value(other.value)
+
+    def get_result(self):
+        return self.value
+
+
+class KllSketch:
+    """
+    Quantile sketch (Karnin, Lang, Liberty). Values go into a stack of
+    compactors, a full compactor sorts its values and promotes every other one to
+    the next level, where every value counts twice as much. The capacity of the
+    levels shrinks by a factor c going down from the top, so memory stays at
+    about k / (1 - c) values no matter how many values were added.
+    Sketches merge by concatenating their levels.
+    """
+
+    __slots__ = ("k", "c", "compactors", "size", "max_size")
+
+    def __init__(self, k=DEFAULT_SKETCH_K, c=2 / 3):
+        self.k = k
+        self.c = c
+        self.compactors: List[List[float]] = []
+        self.size = 0
+        self.max_size = 0
+        self.grow()
+
+    def grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self.capacity(h) for h in range(len(self.compactors)))
+
+    def capacity(self, height: int) -> int:
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * self.c**depth)) + 1
+
+    def update(self, value: float):
+        self.compactors[0].append(value)
+        self.size += 1
+        if self.size >= self.max_size:
+            self.compress()
+
+    def extend(self, values):
+        self.compactors[0].extend(values)
+        self.size += len(values)
+        while self.size >= self.max_size:
+            self.compress()
+
+    def compress(self):
+        for height, compactor in enumerate(self.compactors):
+            if len(compactor) >= self.capacity(height):
+                if height + 1 >= len(self.compactors):
+                    self.grow()
+                compactor.sort()
+                # with an odd number of values, the smallest one stays behind
+                odd = len(compactor) % 2
+                start = odd + random.getrandbits(1)
+                self.compactors[height + 1].extend(compactor[start::2])
+                del compactor[odd:]
+                break
+        self.size = sum(len(compactor) for compactor in self.compactors)
+
+    def merge(self, other: "KllSketch"):
+        while len(self.compactors) < len(other.compactors):
+            self.grow()
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.size = sum(len(compactor) for compactor in self.compactors)
+        while self.size >= self.max_size:
+            self.compress()
+
+    def weighted_values(self) -> List[Tuple[float, int]]:
+        return sorted(
+            (value, 1 << height)
+            for height, compactor in enumerate(self.compactors)
+            for value in compactor
+        )
+
+    def quantile(self, q: float):
+        """
+        Nearest rank quantile, exact as long as no compaction happened
+        """
+        weighted_values = self.weighted_values()
+        if not weighted_values:
+            return None
+        total = sum(weight for _, weight in weighted_values)
+        rank = max(1, math.ceil(q * total))
+        cumulative = 0
+        for value, weight in weighted_values:
+            cumulative += weight
+            if cumulative >= rank:
+                return value
+        return weighted_values[-1][0]
+
+
+class PercentileAggregator(MetricAggregator):
+    __slots__ = ("q", "sketch")
+
+    def __init__(self, q: float):
+        self.q = q
+        self.sketch = KllSketch()
+
+    def on_value(self, value):
+        self.sketch.update(value)
+
+    def on_values(self, values):
+        if len(values):
+            self.sketch.extend(values.tolist() if numpy_array(values) else values)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+
+    def get_result(self):
+        return self.sketch.quantile(self.q)
+
+
+SUPPORTED_AGGRETATIONS = {
+    "min": MinAggregator,
+    "max": MaxAggregator,
+    "avg": AvgAggregator,
+    "sum": SumAggregator,
+    "count": CountAggregator,
+    "stddev": StddevAggregator,
+    "last": LastAggregator,
+    "first": FirstAggregator,
+    "p50": partial(PercentileAggregator, 0.5),
+    "p90": partial(PercentileAggregator, 0.9),
+    "p95": partial(PercentileAggregator, 0.95),
+    "p99": partial(PercentileAggregator, 0.99),
+}
+# the query takes a space aggregation (avg, sum, min, max) to combine the series
+# within a group, the others are about the points of those series
+SPACE_AGGREGATIONS = {
+    "count": "avg",
+    "stddev": "avg",
+    "first": "avg",
+    "last": "avg",
+    "p50": "avg",
+    "p90": "avg",
+    "p95": "avg",
+    "p99": "avg",
+}
@@ -0,0 +1,77 @@
+import heapq
+from typing import Dict, Iterator, List, Tuple
+
+
+class MetricTrieNode:
+    __slots__ = ("children", "volume", "total")
+
+    def __init__(self):
+        self.children: Dict[str, "MetricTrieNode"] = {}
+        # volume of the metric that ends at this node (if any)
+        self.volume = 0
+        # volume of this node and everything below it
+        self.total = 0
+
+
+class MetricTrie:
+    """
+    Metric volumes stored per namespace segment, every node keeps the total of its
+    subtree. After one scan it answers rollups at any depth
+    (kafka, kafka.consumer, kafka.consumer.lag) without going over the metric
+    list again.
+    """
+
+    def __init__(self, split_char="."):
+        self.split_char = split_char
+        self.root = MetricTrieNode()
+
+    def insert(self, metric_name: str, volume: int):
+        node = self.root
+        node.total += volume
+        for part in metric_name.split(self.split_char):
+            node = node.children.setdefault(part, MetricTrieNode())
+            node.total += volume
+        node.volume += volume
+
+    @property
+    def total(self):
+        return self.root.total
+
+    def find(self, prefix: str) -> MetricTrieNode:
+        node = self.root
+        if not prefix:
+            return node
+        for part in prefix.strip(self.split_char).split(self.split_char):
+            node = node.children.get(part)
+            if node is None:
+                return MetricTrieNode()
+        return node
+
+    def rollup(self, depth: int, prefix: str = "") -> Iterator[Tuple[str, int]]:
+        """
+        Yields (name, volume) for all subtrees `depth` levels below prefix. Metrics
+        that end higher up in the tree are yielded by their own name.
+        """
+        start = prefix.strip(self.split_char)
+        stack = [(start, self.find(prefix), 0)]
+        while stack:
+            name, node, level = stack.pop()
+            if level == depth:
+                yield name, node.total
+                continue
+            if node.volume and level > 0:
+                yield name, node.volume
+            for part, child in node.children.items():
+                child_name = f"{name}{self.split_char}{part}" if name else part
+                stack.append((child_name, child, level + 1))
+
+    def top(self, n: int, depth: int, prefix: str = "") -> List[Tuple[str, int]]:
+        """
+        The n heaviest subtrees at the given depth below prefix.
+        """
+        return heapq.nlargest(n, self.rollup(depth, prefix), key=lambda item: item[1])
+
+    def percentage(self, name: str) -> float:
+        if not self.total:
+            return 0.0
+        return self.find(name).total / self.total * 100
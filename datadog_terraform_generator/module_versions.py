@@ -1,7 +1,8 @@
 import os
 import re
 
-import requests
+from datadog_terraform_generator.api import get_session
+from datadog_terraform_generator.pagination import iter_pages, iter_items
 
 
 def get_terraform_files(folder: str):
@@ -83,22 +84,22 @@ def list_module_versions(args):
 
 
 def get_kabisa_datadog_modules():
-    modules = []
     base_url = "https://registry.terraform.io"
-    req = requests.get(f"{base_url}/v1/modules?provider=datadog")
-    data = req.json()
-    for module in data["modules"]:
-        if module["id"].startswith("kabisa"):
-            modules.append(module)
-    next_url = get_next_url(data, base_url)
-    while next_url:
-        req = requests.get(next_url)
-        data = req.json()
-        for module in data["modules"]:
-            if module["id"].startswith("kabisa"):
-                modules.append(module)
-        next_url = get_next_url(data, base_url)
-    return modules
+    session = get_session()
+
+    def fetch_page(url):
+        return session.get(url).json()
+
+    pages = iter_pages(
+        fetch_page,
+        lambda data: get_next_url(data, base_url),
+        first_token=f"{base_url}/v1/modules?provider=datadog",
+    )
+    return [
+        module
+        for module in iter_items(pages, lambda data: data["modules"])
+        if module["id"].startswith("kabisa")
+    ]
 
 
 def version_tuple(version):
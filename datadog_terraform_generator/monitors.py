@@ -5,6 +5,11 @@ from urllib.parse import urlencode
 
 from datadog_terraform_generator.api import DdApi
 from datadog_terraform_generator.config_management import get_config_by_name
+from datadog_terraform_generator.pagination import (
+    DEFAULT_CONCURRENCY,
+    iter_counted_pages,
+    iter_items,
+)
 
 
 def get_monitor_by_id(dd_api: DdApi, monitor_id, group_states):
@@ -20,13 +25,41 @@ def format_notification_channel(notification_channel_dict: dict) -> str:
     return notification_channel_dict["handle"]
 
 
-def pages_left(metadata) -> bool:
-    return metadata["page"] < metadata["page_count"]
+DEFAULT_PER_PAGE = 100
 
 
-def get_monitors_by_query(dd_api: DdApi, query: str):
-    resp = None
-    params = {"query": query, "page": 0}
+def search_monitors(
+    dd_api: DdApi,
+    query: str,
+    per_page=DEFAULT_PER_PAGE,
+    concurrency=DEFAULT_CONCURRENCY,
+):
+    """
+    Yields all monitors matching the query. The first page tells the page count,
+    the other pages are then fetched in parallel but still yielded in page order.
+    """
+
+    def fetch_page(page):
+        params = {"query": query, "page": page, "per_page": per_page}
+        return dd_api.request(f"api/v1/monitor/search?{urlencode(params)}")
+
+    def remaining_pages(first_page):
+        return range(1, first_page["metadata"]["page_count"])
+
+    return iter_items(
+        iter_counted_pages(
+            fetch_page, remaining_pages, first_token=0, concurrency=concurrency
+        ),
+        lambda page: page["monitors"],
+    )
+
+
+def get_monitors_by_query(
+    dd_api: DdApi,
+    query: str,
+    per_page=DEFAULT_PER_PAGE,
+    concurrency=DEFAULT_CONCURRENCY,
+):
     writer = csv.writer(
         sys.stdout, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL
     )
@@ -40,36 +73,39 @@ def get_monitors_by_query(dd_api: DdApi, query: str):
         ]
     )
     count = 0
-    while resp is None or pages_left(resp["metadata"]):
-        formatted_qry = urlencode(params)
-        resp = dd_api.request(f"api/v1/monitor/search?{formatted_qry}")
-        for monitor in resp["monitors"]:
-            writer.writerow(
-                [
-                    str(monitor["id"]),
-                    monitor["name"],
-                    ",".join(monitor["tags"]),
-                    ",".join(
-                        format_notification_channel(chan)
-                        for chan in monitor["notifications"]
-                    ),
-                    monitor["query"].replace("\\", "\\\\").replace('"', '"'),
-                ]
-            )
-            count += 1
-        params["page"] += 1
+    for monitor in search_monitors(
+        dd_api, query, per_page=per_page, concurrency=concurrency
+    ):
+        writer.writerow(
+            [
+                str(monitor["id"]),
+                monitor["name"],
+                ",".join(monitor["tags"]),
+                ",".join(
+                    format_notification_channel(chan)
+                    for chan in monitor["notifications"]
+                ),
+                monitor["query"].replace("\\", "\\\\").replace('"', '"'),
+            ]
+        )
+        count += 1
     print("Count:", count)
 
 
 def main(args):
     config = get_config_by_name(args.config_name)
-    dd_api = DdApi.from_config(config)
+    dd_api = DdApi.from_config(config, concurrency=args.concurrency)
     if getattr(args, "monitor_id", None):
         get_monitor_by_id(
             dd_api=dd_api, monitor_id=args.monitor_id, group_states=args.group_states
         )
     elif getattr(args, "query", None):
-        get_monitors_by_query(dd_api=dd_api, query=args.query)
+        get_monitors_by_query(
+            dd_api=dd_api,
+            query=args.query,
+            per_page=args.per_page,
+            concurrency=args.concurrency,
+        )
     else:
         raise NotImplementedError("Parameters unset?")
 
@@ -79,6 +115,18 @@ def add_sub_parser(subparsers):
     parser.add_argument("--monitor_id")
     parser.add_argument("--query")
     parser.add_argument("--group_states")
+    parser.add_argument(
+        "--per_page",
+        help="Number of monitors per search page",
+        type=int,
+        default=DEFAULT_PER_PAGE,
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of search pages fetched at the same time",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+    )
     parser.set_defaults(func=main)
 
 
@@ -90,4 +138,6 @@ if __name__ == "__main__":
     args = Object()
     args.query = 'service:"kong" notification:servicenow-toyotaeurope'
     args.config_name = ""
+    args.per_page = DEFAULT_PER_PAGE
+    args.concurrency = DEFAULT_CONCURRENCY
     main(args)
@@ -0,0 +1,72 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+DEFAULT_CONCURRENCY = 8
+
+
+def iter_pages(
+    fetch_page: Callable[[Any], dict],
+    next_token: Callable[[dict], Optional[Any]],
+    first_token: Any = None,
+) -> Iterator[dict]:
+    """
+    Pagination for endpoints where every page tells where the next one is (cursors,
+    next urls). As soon as a page is in, the next one is requested on a background
+    worker, so the caller processes page n while page n+1 is on its way.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(fetch_page, first_token)
+        while future is not None:
+            page = future.result()
+            token = next_token(page)
+            future = executor.submit(fetch_page, token) if token is not None else None
+            yield page
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_parallel_pages(
+    fetch_page: Callable[[Any], dict],
+    tokens: Iterable[Any],
+    concurrency=DEFAULT_CONCURRENCY,
+) -> Iterator[dict]:
+    """
+    Fetches the pages of all tokens with at most `concurrency` requests in flight.
+    Pages are yielded in the order of the tokens as soon as they are in.
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = deque()
+        for token in tokens:
+            futures.append(executor.submit(fetch_page, token))
+            if len(futures) >= concurrency:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_counted_pages(
+    fetch_page: Callable[[Any], dict],
+    remaining_tokens: Callable[[dict], Iterable[Any]],
+    first_token: Any = None,
+    concurrency=DEFAULT_CONCURRENCY,
+) -> Iterator[dict]:
+    """
+    Pagination for endpoints that reveal the total amount of results on the first
+    page (page counts, offsets). After the first page all others are fetched in
+    parallel.
+    """
+    first_page = fetch_page(first_token)
+    yield first_page
+    yield from iter_parallel_pages(
+        fetch_page, remaining_tokens(first_page), concurrency=concurrency
+    )
+
+
+def iter_items(pages: Iterable[dict], get_items: Callable[[dict], Iterable]):
+    for page in pages:
+        yield from get_items(page)
@@ -22,9 +22,13 @@ def interpret_time(time) -> Arrow:
     return arrow.get(time)
 
 
-def query(dd_api: DdApi, _from: Arrow, to: Arrow, qry):
+def query_path(_from: Arrow, to: Arrow, qry) -> str:
     params = {"from": int(_from.timestamp()), "to": int(to.timestamp()), "query": qry}
-    return dd_api.request(f"api/v1/query?{urlencode(params)}")
+    return f"api/v1/query?{urlencode(params)}"
+
+
+def query(dd_api: DdApi, _from: Arrow, to: Arrow, qry):
+    return dd_api.request(query_path(_from, to, qry))
 
 
 def main(args):
@@ -0,0 +1,152 @@
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 60
+
+
+def endpoint_family(path: str) -> str:
+    """
+    Datadog rate limits apply per endpoint, not per resource. So
+    api/v2/metrics/kafka.lag/volumes and api/v2/metrics/kong.latency/volumes share
+    a limit. We keep api, the version and the resource and the trailing action,
+    everything in between (ids, metric names) is replaced by a *
+    """
+    path = path.split("?", maxsplit=1)[0].strip("/")
+    parts = path.split("/")
+    family = []
+    for idx, part in enumerate(parts):
+        is_last = idx == len(parts) - 1
+        if idx < 3 or (is_last and re.match(r"^[a-z_\-]+$", part)):
+            family.append(part)
+        else:
+            family.append("*")
+    return "/".join(family)
+
+
+def header_int(headers, name) -> Optional[int]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket that learns its rate from the x-ratelimit-* response headers.
+    As long as nothing has been learned, requests are let through unpaced.
+    The amount of tokens is clamped on the remaining count the server reports
+    and when the server says nothing is remaining we wait for the reset.
+    """
+
+    def __init__(self):
+        self.rate = None
+        self.capacity = None
+        self.tokens = 0.0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+        self.updated_at = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.blocked_until:
+                    if self.rate is None:
+                        return
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.blocked_until - now
+            time.sleep(wait)
+
+    def update(self, limit, period, remaining, reset):
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            first_update = self.rate is None
+            if limit and period:
+                self.rate = limit / period
+                self.capacity = limit
+                self.tokens = min(self.tokens, self.capacity)
+            if remaining is not None:
+                if first_update:
+                    self.tokens = remaining
+                else:
+                    self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and reset is not None:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+
+
+class RateLimiter:
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, path) -> TokenBucket:
+        family = endpoint_family(path)
+        with self.lock:
+            if family not in self.buckets:
+                self.buckets[family] = TokenBucket()
+            return self.buckets[family]
+
+    def acquire(self, path):
+        self.bucket(path).acquire()
+
+    def on_response(self, path, headers):
+        limit = header_int(headers, "x-ratelimit-limit")
+        if limit is None:
+            return
+        self.bucket(path).update(
+            limit=limit,
+            period=header_int(headers, "x-ratelimit-period"),
+            remaining=header_int(headers, "x-ratelimit-remaining"),
+            reset=header_int(headers, "x-ratelimit-reset"),
+        )
+
+
+def backoff_seconds(attempt, headers=None) -> float:
+    """
+    Exponential backoff with full jitter. If the server tells us when the rate
+    limit resets we wait for that plus a bit of jitter so parallel workers don't
+    all come back at the same moment.
+    """
+    reset = header_int(headers or {}, "x-ratelimit-reset")
+    if reset is not None:
+        return reset + random.uniform(0, BACKOFF_BASE_SECONDS)
+    return random.uniform(
+        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+    )
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key) -> RateLimiter:
+    """
+    Rate limits are per organization, so DdApi instances using the same key share
+    one limiter.
+    """
+    with _rate_limiters_lock:
+        if api_key not in _rate_limiters:
+            _rate_limiters[api_key] = RateLimiter()
+        return _rate_limiters[api_key]
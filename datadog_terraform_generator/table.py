@@ -1,91 +1,41 @@
-import abc
 import csv
 import locale
-import math
 import sys
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from arrow import Arrow
 
 from datadog_terraform_generator.api import DdApi
 from datadog_terraform_generator.config_management import get_config_by_name
-from datadog_terraform_generator.query import query, interpret_time
-
-
-class MetricAggregator(abc.ABC):
-    def __int__(self):
-        raise NotImplementedError("__int__")
-
-    def on_value(self, value):
-        raise NotImplementedError("on_value")
-
-    def get_result(self):
-        raise NotImplementedError("get_result")
-
-
-class MaxAggregator(MetricAggregator):
-    def __init__(self):
-        self.max = -math.inf
-
-    def on_value(self, value):
-        if value > self.max:
-            self.max = value
-
-    def get_result(self):
-        return self.max
-
-
-class MinAggregator(MetricAggregator):
-    def __init__(self):
-        self.min = math.inf
-
-    def on_value(self, value):
-        if value < self.min:
-            self.min = value
-
-    def get_result(self):
-        return self.min
-
-
-class AvgAggregator(MetricAggregator):
-    def __init__(self):
-        self.values = []
-
-    def on_value(self, value):
-        self.values.append(value)
-
-    def get_result(self):
-        if self.values:
-            return sum(self.values) / len(self.values)
-
-
-class LastAggregator(MetricAggregator):
-    def __init__(self):
-        self.value = None
-
-    def on_value(self, value):
-        self.value = value
-
-    def get_result(self):
-        return self.value
-
-
-class FirstAggregator(MetricAggregator):
-    def __init__(self):
-        pass
-
-    def on_value(self, value):
-        if not hasattr(self, "value"):
-            self.value = value
-
-    def get_result(self):
-        return getattr(self, "value")
-
-
-SUPPORTED_AGGRETATIONS = {
-    "min": MinAggregator,
-    "max": MaxAggregator,
-    "avg": AvgAggregator,
-    "last": LastAggregator,
-    "first": FirstAggregator,
+from datadog_terraform_generator.metric_aggregators import (
+    SPACE_AGGREGATIONS,
+    SUPPORTED_AGGRETATIONS,
+    MetricAggregator,
+    series_values,
+)
+from datadog_terraform_generator.pagination import (
+    DEFAULT_CONCURRENCY,
+    iter_parallel_pages,
+)
+from datadog_terraform_generator.query import query_path, interpret_time
+
+# queries packed into one api/v1/query request, comma separated
+MAX_QUERIES_PER_REQUEST = 10
+# keeps the request url well below the limits of proxies and the api
+MAX_QUERY_LENGTH = 4000
+# Datadog rolls up longer time ranges into coarser points, which makes max, min
+# and percentiles wrong. Up to an hour we get the points at their own resolution.
+DEFAULT_CHUNK_MINUTES = 60
+# aggregations Datadog can do for us with .rollup(function, window): the rollup
+# function and the aggregation that combines the rolled up points client side.
+# The max or min of a rollup is exact for any window, so these are queried over
+# the whole time range at once. The others get the points, chunk by chunk.
+# A rollup of sum or count works on the raw points of every series, while the
+# points we get are combined per group and, once there are more than fit in a
+# response, averaged per interval, so those would give other results.
+PUSHDOWN_ROLLUPS = {
+    "max": ("max", "max"),
+    "min": ("min", "min"),
 }
 
 
@@ -95,11 +45,14 @@ def table(
     _from: str,
     to: str,
     output_path: str,
+    concurrency=DEFAULT_CONCURRENCY,
+    chunk_minutes=DEFAULT_CHUNK_MINUTES,
+    pushdown=True,
 ):
 
     locale.setlocale(category=locale.LC_CTYPE, locale="en_us")
     config = get_config_by_name(None)
-    dd_api = DdApi.from_config(config)
+    dd_api = DdApi.from_config(config, concurrency=concurrency)
     from_arrow = interpret_time(_from)
     to_arrow = interpret_time(to)
     filter_str = "*"
@@ -115,6 +68,9 @@ def table(
         group_by_str=group_by_str,
         from_arrow=from_arrow,
         to_arrow=to_arrow,
+        concurrency=concurrency,
+        chunk_seconds=chunk_minutes * 60,
+        pushdown=pushdown,
     )
 
     rows = metric_data_to_rows(metric_data, metric_aggregations)
@@ -127,22 +83,168 @@ def table(
     writer.writerows(rows)
 
 
+def batch_queries(
+    queries: List[str],
+    max_queries=MAX_QUERIES_PER_REQUEST,
+    max_length=MAX_QUERY_LENGTH,
+) -> List[List[int]]:
+    """
+    Groups the queries (by index) into as few requests as the limits allow
+    """
+    batches = []
+    batch: List[int] = []
+    length = 0
+    for idx, qry in enumerate(queries):
+        if batch and (len(batch) >= max_queries or length + 1 + len(qry) > max_length):
+            batches.append(batch)
+            batch = []
+            length = 0
+        batch.append(idx)
+        length += len(qry) + (1 if length else 0)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def demux_series(query_res, metric_names: List[str]) -> List[List[dict]]:
+    """
+    Splits the series of a request with comma separated queries per query, the
+    query_index of a series tells which query it belongs to.
+    """
+    series_per_query = [[] for _ in metric_names]
+    for item in query_res.get("series", []):
+        query_index = item.get("query_index")
+        if query_index is None:
+            query_index = metric_names.index(item["metric"])
+        series_per_query[query_index].append(item)
+    return series_per_query
+
+
+def split_into_chunks(
+    from_arrow: Arrow, to_arrow: Arrow, chunk_seconds: int
+) -> List[Tuple[Arrow, Arrow]]:
+    """
+    Consecutive (from, to) chunks that start at multiples of chunk_seconds since
+    the epoch, only the first and last one can be shorter. The intervals Datadog
+    rolls points up in are aligned to the epoch as well, so an interval never
+    spans two chunks. The query api includes both ends so a chunk ends a second
+    before the next one starts.
+    """
+    if not chunk_seconds:
+        return [(from_arrow, to_arrow)]
+    chunks = []
+    start = from_arrow
+    while start < to_arrow:
+        timestamp = int(start.timestamp())
+        end = start.shift(seconds=chunk_seconds - timestamp % chunk_seconds)
+        if end >= to_arrow:
+            chunks.append((start, to_arrow))
+        else:
+            chunks.append((start, end.shift(seconds=-1)))
+        start = end
+    return chunks
+
+
+def plan_query(
+    aggregation: str,
+    metric_name: str,
+    filter_str: str,
+    group_by_str: str,
+    window_seconds: int,
+    pushdown=True,
+) -> Tuple[str, str]:
+    """
+    Returns the query and the aggregation that finalizes its points client side.
+    Where possible the reduction is pushed down to Datadog with a rollup over the
+    whole window, so every tag set comes back with one or two points in stead of
+    every point of the window.
+    Only pushed down queries can span more than a chunk.
+    """
+    if pushdown and aggregation in PUSHDOWN_ROLLUPS:
+        rollup_function, client_aggregation = PUSHDOWN_ROLLUPS[aggregation]
+        return (
+            f"{aggregation}:{metric_name}{{{filter_str}}}{group_by_str}"
+            f".rollup({rollup_function}, {window_seconds})",
+            client_aggregation,
+        )
+    space_aggregation = SPACE_AGGREGATIONS.get(aggregation, aggregation)
+    return (
+        f"{space_aggregation}:{metric_name}{{{filter_str}}}{group_by_str}",
+        aggregation,
+    )
+
+
 def query_metrics(
-    agg_metric_names, dd_api, filter_str, group_by_str, from_arrow, to_arrow
+    agg_metric_names,
+    dd_api,
+    filter_str,
+    group_by_str,
+    from_arrow,
+    to_arrow,
+    concurrency=DEFAULT_CONCURRENCY,
+    chunk_seconds=DEFAULT_CHUNK_MINUTES * 60,
+    pushdown=True,
 ):
+    """
+    Packs the queries of all metrics into as few requests as possible and fires
+    those concurrently. Pushed down queries cover the whole time range in one go,
+    the others are requested per time chunk. The aggregators of every chunk are
+    merged per tag set in time order.
+    """
     metric_data = {}
     metric_aggregations = {}
+    agg_metrics = []
+    queries = []
+    chunks = split_into_chunks(from_arrow, to_arrow, chunk_seconds)
+    window_seconds = int((to_arrow - from_arrow).total_seconds()) + 1
+    pushed_down = []
+    chunked = []
     for agg_metric in agg_metric_names:
         aggregation, metric_name = agg_metric.split(":", maxsplit=1)
         assert aggregation in SUPPORTED_AGGRETATIONS
         metric_aggregations[metric_name] = aggregation
-        query_res = query(
-            _from=from_arrow,
-            to=to_arrow,
-            qry=f"{aggregation}:{metric_name}{{{filter_str}}}{group_by_str}",
-            dd_api=dd_api,
+        qry, client_aggregation = plan_query(
+            aggregation,
+            metric_name,
+            filter_str,
+            group_by_str,
+            window_seconds,
+            pushdown=pushdown,
+        )
+        is_pushed_down = pushdown and aggregation in PUSHDOWN_ROLLUPS
+        (pushed_down if is_pushed_down else chunked).append(len(queries))
+        agg_metrics.append((client_aggregation, metric_name))
+        queries.append(qry)
+
+    def batches_of(indexes):
+        batches = batch_queries([queries[idx] for idx in indexes])
+        return [[indexes[pos] for pos in batch] for batch in batches]
+
+    requests = [((from_arrow, to_arrow), batch) for batch in batches_of(pushed_down)]
+    requests.extend((chunk, batch) for chunk in chunks for batch in batches_of(chunked))
+    aggregators: List[Dict[str, MetricAggregator]] = [{} for _ in agg_metrics]
+
+    def fetch(request):
+        chunk, batch = request
+        return dd_api.request(
+            query_path(*chunk, ",".join(queries[idx] for idx in batch))
+        )
+
+    # responses come in the order of the requests, which are in time order, at most
+    # `concurrency` of them are held in memory
+    responses = iter_parallel_pages(fetch, requests, concurrency=concurrency)
+    for (_, batch), query_res in zip(requests, responses):
+        series_per_query = demux_series(
+            query_res, [agg_metrics[idx][1] for idx in batch]
         )
-        query_res_to_metric_data(query_res, metric_data, aggregation, metric_name)
+        for idx, series in zip(batch, series_per_query):
+            aggregation, metric_name = agg_metrics[idx]
+            merge_aggregators(
+                aggregators[idx],
+                query_res_to_aggregators({"series": series}, aggregation, metric_name),
+            )
+    for (_, metric_name), metric_aggregators in zip(agg_metrics, aggregators):
+        store_results(metric_data, metric_aggregators, metric_name)
 
     return metric_aggregations, metric_data
 
@@ -165,28 +267,37 @@ def metric_data_to_rows(
     return output_list
 
 
-def query_res_to_metric_data(
-    query_res, metric_data: Dict, aggregation: str, metric_name: str
-):
+def query_res_to_aggregators(
+    query_res, aggregation: str, metric_name: str
+) -> Dict[str, MetricAggregator]:
     aggregators = {}
     constructor = SUPPORTED_AGGRETATIONS[aggregation]
     for item in query_res["series"]:
         tagset_str = ",".join(item["tag_set"])
         assert item["metric"] == metric_name
 
-        if tagset_str not in metric_data:
-            metric_data[tagset_str] = {}
         if tagset_str not in aggregators:
             aggregators[tagset_str] = constructor()
 
-        aggregator = aggregators[tagset_str]
-        for point in item["pointlist"]:
-            if point[1] is None:
-                continue
-            aggregator.on_value(point[1])
+        aggregators[tagset_str].on_values(series_values(item["pointlist"]))
+    return aggregators
+
 
+def merge_aggregators(
+    into: Dict[str, MetricAggregator], aggregators: Dict[str, MetricAggregator]
+):
+    for tagset_str, aggregator in aggregators.items():
+        if tagset_str in into:
+            into[tagset_str].merge(aggregator)
+        else:
+            into[tagset_str] = aggregator
+
+
+def store_results(
+    metric_data: Dict, aggregators: Dict[str, MetricAggregator], metric_name: str
+):
     for tagset_str, aggregator in aggregators.items():
-        metric_data[tagset_str][metric_name] = aggregator.get_result()
+        metric_data.setdefault(tagset_str, {})[metric_name] = aggregator.get_result()
 
 
 def main(args):
@@ -196,6 +307,9 @@ def main(args):
         to=args.to,
         group_by=args.group_by,
         output_path=args.output,
+        concurrency=args.concurrency,
+        chunk_minutes=args.chunk_minutes,
+        pushdown=not args.no_pushdown,
     )
 
 
@@ -204,7 +318,8 @@ def add_sub_parser(subparsers):
     parser.add_argument(
         "--agg_metric_names",
         nargs="+",
-        help="Metric names and their aggregations. This is your columns. Example: agg_metric_names agg:metric.name agg:metric.name2",
+        help="Metric names and their aggregations. This is your columns. Example: agg_metric_names agg:metric.name agg:metric.name2. "
+        f"Aggregations: {', '.join(SUPPORTED_AGGRETATIONS)}",
     )
     parser.add_argument(
         "--group_by",
@@ -218,6 +333,25 @@ def add_sub_parser(subparsers):
         "--to", help="End of the queried time period, seconds since the Unix epoch."
     )
     parser.add_argument("--output", help="Filename to write to", default="stdout")
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of query requests in flight",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--chunk_minutes",
+        help="Query longer time ranges in chunks of this many minutes, so Datadog "
+        "doesn't roll up the points. 0 queries the whole range at once",
+        type=int,
+        default=DEFAULT_CHUNK_MINUTES,
+    )
+    parser.add_argument(
+        "--no_pushdown",
+        help="Always fetch all points, in stead of letting Datadog roll up "
+        f"{', '.join(PUSHDOWN_ROLLUPS)} per chunk",
+        action="store_true",
+    )
     parser.set_defaults(func=main)
 
 
@@ -0,0 +1,165 @@
+import re
+from collections import defaultdict
+from fnmatch import translate
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Pattern
+
+KEYWORDS = ("and", "or", "not")
+TOKEN_RE = re.compile(r"\s*([(),]|[^\s(),]+)")
+
+
+def index_tags(tags: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    "env:prd", "role:web", "role:db", "linux" -> {"env": ["prd"], "role": ["web",
+    "db"], "linux": [""]}
+    """
+    index = defaultdict(list)
+    for tag in tags:
+        key, _, value = tag.partition(":")
+        index[key].append(value)
+    return index
+
+
+class TagTerm:
+    """
+    key:pattern, matches when one of the values of key matches the pattern.
+    Several patterns of the same key are combined into one regex.
+    """
+
+    __slots__ = ("key", "patterns", "regex")
+
+    def __init__(self, key: str, patterns: List[str]):
+        self.key = key
+        self.patterns = patterns
+        self.regex: Optional[Pattern] = None
+        if patterns:
+            self.regex = re.compile("|".join(translate(p) for p in patterns))
+
+    def matches(self, tag_index: Dict[str, List[str]]) -> bool:
+        values = tag_index.get(self.key)
+        if not values:
+            return False
+        if self.regex is None:
+            return True
+        match = self.regex.match
+        return any(match(value) for value in values)
+
+
+class AnyOf:
+    __slots__ = ("matchers",)
+
+    def __init__(self, matchers):
+        self.matchers = matchers
+
+    def matches(self, tag_index) -> bool:
+        return any(matcher.matches(tag_index) for matcher in self.matchers)
+
+
+class AllOf:
+    __slots__ = ("matchers",)
+
+    def __init__(self, matchers):
+        self.matchers = matchers
+
+    def matches(self, tag_index) -> bool:
+        return all(matcher.matches(tag_index) for matcher in self.matchers)
+
+
+class Not:
+    __slots__ = ("matcher",)
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+
+    def matches(self, tag_index) -> bool:
+        return not self.matcher.matches(tag_index)
+
+
+def any_of(matchers):
+    """
+    Terms on the same key are merged into one term, so an OR over many values of a
+    key costs one lookup and one regex match per value.
+    """
+    terms_by_key: Dict[str, TagTerm] = {}
+    others = []
+    for matcher in matchers:
+        if isinstance(matcher, TagTerm) and matcher.regex is not None:
+            if matcher.key in terms_by_key:
+                previous = terms_by_key[matcher.key]
+                matcher = TagTerm(matcher.key, previous.patterns + matcher.patterns)
+            terms_by_key[matcher.key] = matcher
+        else:
+            others.append(matcher)
+    merged = list(terms_by_key.values()) + others
+    return merged[0] if len(merged) == 1 else AnyOf(merged)
+
+
+class Parser:
+    """
+    Recursive descent parser for:
+        expr     := and_expr (("or" | ",") and_expr)*
+        and_expr := not_expr (["and"] not_expr)*
+        not_expr := "not" not_expr | "(" expr ")" | key:pattern
+    Terms next to each other without an operator are AND-ed, like in the Datadog
+    search syntax.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.tokens = TOKEN_RE.findall(pattern)
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of tags pattern {self.pattern}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        matcher = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected {self.peek()} in tags pattern {self.pattern}")
+        return matcher
+
+    def parse_or(self):
+        matchers = [self.parse_and()]
+        while self.peek() in ("or", ","):
+            self.take()
+            matchers.append(self.parse_and())
+        return any_of(matchers)
+
+    def parse_and(self):
+        matchers = [self.parse_not()]
+        while self.peek() is not None and self.peek() not in ("or", ",", ")"):
+            if self.peek() == "and":
+                self.take()
+            matchers.append(self.parse_not())
+        return matchers[0] if len(matchers) == 1 else AllOf(matchers)
+
+    def parse_not(self):
+        token = self.take()
+        if token == "not":
+            return Not(self.parse_not())
+        if token == "(":
+            matcher = self.parse_or()
+            if self.take() != ")":
+                raise ValueError(f"Missing ) in tags pattern {self.pattern}")
+            return matcher
+        if token in KEYWORDS or token in (")", ","):
+            raise ValueError(f"Unexpected {token} in tags pattern {self.pattern}")
+        key, colon, value = token.partition(":")
+        # a pattern without a value matches any value of the key
+        return TagTerm(key, [value] if colon else [])
+
+
+@lru_cache(maxsize=128)
+def compile_tags_pattern(tags_pattern: str):
+    """
+    Compiles a tags pattern like "(env:prd,env:acc) not role:db*" into a matcher,
+    call .matches(index_tags(tags)) on it.
+    """
+    return Parser(tags_pattern).parse()
@@ -7,6 +7,7 @@ setup(
     packages=["datadog_terraform_generator"],
     package_data={"datadog_terraform_generator": ["*.tf", "tf_monitor_defaults.yaml"]},
     install_requires=["requests", "pyyaml", "argcomplete", "arrow", "pyhcl"],
+    extras_require={"zstd": ["zstandard"], "numpy": ["numpy"]},
     entry_points={
         "console_scripts": ["ddtfgen=datadog_terraform_generator.main:main"],
     },
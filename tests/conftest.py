@@ -0,0 +1,27 @@
+import copy
+import threading
+
+import pytest
+from mock import Mock
+
+
+@pytest.fixture
+def fake_api():
+    """
+    Makes a stand in for DdApi, its request(path, data) is answered by handler and
+    every (path, data) it was called with is recorded in requested, also when
+    called from worker threads. data is copied, callers may change it afterwards.
+    """
+
+    def make(handler, **attributes):
+        lock = threading.Lock()
+        requested = []
+
+        def request(path, data=None):
+            with lock:
+                requested.append((path, copy.deepcopy(data)))
+            return handler(path, data)
+
+        return Mock(request=request, requested=requested, **attributes)
+
+    return make
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from mock import patch
+
+from datadog_terraform_generator.api import DdApi, get_session
+from datadog_terraform_generator.async_api import AsyncDdApi
+from datadog_terraform_generator.pagination import iter_parallel_pages
+from datadog_terraform_generator.rate_limit import TokenBucket, endpoint_family
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(
+                self.server.max_in_flight, self.server.in_flight
+            )
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        self.server.requests.append((self.path, self.client_address[1]))
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        status, headers = 200, {}
+        if self.server.responses:
+            status, headers = self.server.responses.pop(0)
+        self.send_response(status)
+        for ky, vl in headers.items():
+            self.send_header(ky, vl)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.responses = []
+    server.delay = 0
+    server.lock = threading.Lock()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def stub_api(server, **kwargs):
+    host, port = server.server_address
+    return DdApi(f"http://{host}:{port}/", "api_key", "app_key", **kwargs)
+
+
+def test_connection_is_reused(stub_server):
+    dd_api = stub_api(stub_server)
+    for idx in range(5):
+        assert dd_api.request(f"api/v1/hosts?start={idx}") == {
+            "path": f"/api/v1/hosts?start={idx}"
+        }
+    client_ports = {port for _, port in stub_server.requests}
+    assert len(client_ports) == 1
+
+
+def test_session_is_shared_per_pool_settings():
+    assert get_session(pool_size=3) is get_session(pool_size=3)
+    assert get_session(pool_size=3) is not get_session(pool_size=4)
+
+
+def test_headers_are_prebuilt(stub_server):
+    dd_api = stub_api(stub_server)
+    assert dd_api.headers["DD-API-KEY"] == "api_key"
+    assert dd_api.headers["Accept-Encoding"] == "gzip"
+
+
+def test_endpoint_family():
+    assert (
+        endpoint_family("api/v2/metrics/kafka.consumer.lag/volumes")
+        == "api/v2/metrics/*/volumes"
+    )
+    assert endpoint_family("/api/v1/monitor/2001855") == "api/v1/monitor/*"
+    assert endpoint_family("api/v1/monitor/search?page=2") == "api/v1/monitor/search"
+
+
+def test_token_bucket_paces_at_learned_rate():
+    bucket = TokenBucket()
+    bucket.update(limit=10, period=10, remaining=0, reset=None)
+    with patch("datadog_terraform_generator.rate_limit.time.sleep") as sleep:
+        sleep.side_effect = lambda secs: setattr(
+            bucket, "tokens", bucket.tokens + secs * bucket.rate
+        )
+        bucket.acquire()
+    assert sleep.call_args[0][0] == pytest.approx(1, abs=0.01)
+
+
+def test_retries_server_errors(stub_server):
+    stub_server.responses = [(503, {}), (429, {"x-ratelimit-reset": "0"})]
+    dd_api = stub_api(stub_server)
+    with patch("datadog_terraform_generator.api.time.sleep"):
+        assert dd_api.request("api/v1/hosts") == {"path": "/api/v1/hosts"}
+    assert len(stub_server.requests) == 3
+
+
+def test_parallel_requests_bound_concurrency(stub_server):
+    stub_server.delay = 0.05
+    dd_api = stub_api(stub_server)
+    paths = [f"api/v1/monitor/{idx}" for idx in range(12)]
+    results = list(iter_parallel_pages(dd_api.request, paths, concurrency=4))
+    assert [res["path"] for res in results] == [f"/{path}" for path in paths]
+    assert 1 < stub_server.max_in_flight <= 4
+
+
+def test_async_api_bounds_concurrency(stub_server):
+    stub_server.delay = 0.05
+    async_api = AsyncDdApi(stub_api(stub_server), concurrency=4)
+    paths = [f"api/v1/monitor/{idx}" for idx in range(12)]
+
+    async def fetch_all():
+        # gather is awaited from within a running event loop
+        return await async_api.gather(paths)
+
+    try:
+        results = asyncio.run(fetch_all())
+    finally:
+        async_api.close()
+    assert [res["path"] for res in results] == [f"/{path}" for path in paths]
+    assert 1 < stub_server.max_in_flight <= 4
+
+
+def test_pool_holds_a_connection_per_parallel_request(stub_server):
+    stub_server.delay = 0.02
+    host, port = stub_server.server_address
+    config = {
+        "datadog_url": f"http://{host}:{port}/",
+        "api_key": "api_key",
+        "app_key": "app_key",
+        "pool_size": 4,
+    }
+    dd_api = DdApi.from_config(config, concurrency=12)
+    paths = [f"api/v1/monitor/{idx}" for idx in range(36)]
+    for _ in range(2):
+        list(iter_parallel_pages(dd_api.request, paths, concurrency=12))
+    # no connection was discarded because the pool was full
+    client_ports = {port for _, port in stub_server.requests}
+    assert len(client_ports) <= 12
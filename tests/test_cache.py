@@ -0,0 +1,49 @@
+from mock import patch
+
+from datadog_terraform_generator.cache import ACCESS_REFRESH_SECONDS, SqliteCache
+
+
+def test_entries_expire_per_entry(tmp_path):
+    cache = SqliteCache("test", path=str(tmp_path / "cache.sqlite3"))
+    with patch("datadog_terraform_generator.cache.time.time", return_value=1000):
+        cache.set("short", "a", ttl_seconds=10)
+        cache.set("long", "b", ttl_seconds=100)
+    with patch("datadog_terraform_generator.cache.time.time", return_value=1050):
+        assert cache.get("short") == (False, None)
+        assert cache.get("long") == (True, "b")
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 1}
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = SqliteCache("test", max_entries=2, path=str(tmp_path / "cache.sqlite3"))
+    for idx, key in enumerate(["a", "b", "c"]):
+        with patch("datadog_terraform_generator.cache.time.time", return_value=idx):
+            cache.set(key, {"value": key})
+    with patch(
+        "datadog_terraform_generator.cache.time.time",
+        return_value=ACCESS_REFRESH_SECONDS + 10,
+    ):
+        cache.get("a")
+    cache.evict()
+    assert cache.get("a") == (True, {"value": "a"})
+    assert cache.get("b") == (False, None)
+    assert cache.get("c") == (True, {"value": "c"})
+
+
+def test_namespaces_share_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SqliteCache("one", path=path).set("key", 1)
+    assert SqliteCache("one", path=path).get("key") == (True, 1)
+    assert SqliteCache("two", path=path).get("key") == (False, None)
+
+
+def test_reads_only_write_stale_access_times(tmp_path):
+    cache = SqliteCache("test", path=str(tmp_path / "cache.sqlite3"))
+    cache.set("key", 1)
+    statements = []
+    cache.connection.set_trace_callback(statements.append)
+    for _ in range(10):
+        assert cache.get("key") == (True, 1)
+        assert cache.get("other") == (False, None)
+    assert not [s for s in statements if not s.startswith("SELECT")]
+    assert cache.stats() == {"entries": 1, "hits": 10, "misses": 10}
@@ -0,0 +1,18 @@
+import random
+
+from datadog_terraform_generator.external_sort import external_sort
+
+
+def test_external_sort_spills_and_merges():
+    items = [(random.randint(0, 50), nr) for nr in range(1000)]
+    result = list(external_sort(items, key=lambda item: item[0], max_in_memory=64))
+    # stable, like sorted
+    assert result == sorted(items, key=lambda item: item[0])
+
+
+def test_external_sort_in_memory():
+    assert list(external_sort(["b", "c", "a"], key=str, max_in_memory=10)) == [
+        "a",
+        "b",
+        "c",
+    ]
@@ -0,0 +1,57 @@
+from datadog_terraform_generator.generate_tf_module import (
+    hydrate_monitors,
+    supported_monitors,
+)
+
+
+def full_monitor(monitor_id, monitor_type="query alert"):
+    return {
+        "id": monitor_id,
+        "name": f"monitor {monitor_id}",
+        "type": monitor_type,
+        "query": "avg(last_5m):avg:system.load.1{*} > 2",
+        "message": "load is high",
+        "options": {"thresholds": {"critical": 2}},
+        "priority": None,
+    }
+
+
+def search_result(monitor_id, monitor_type="query alert"):
+    # what api/v1/monitor/search returns, no message and options
+    monitor = full_monitor(monitor_id, monitor_type)
+    del monitor["message"]
+    del monitor["options"]
+    return monitor
+
+
+def get_monitor(path, data):
+    return full_monitor(int(path.rsplit("/", 1)[1]))
+
+
+def test_hydrate_monitors_fetches_incomplete_monitors(fake_api):
+    dd_api = fake_api(get_monitor)
+    monitors = list(
+        hydrate_monitors(dd_api, [search_result(nr) for nr in range(20)], concurrency=4)
+    )
+    assert monitors == [full_monitor(nr) for nr in range(20)]
+    assert sorted(path for path, _ in dd_api.requested) == sorted(
+        f"api/v1/monitor/{nr}" for nr in range(20)
+    )
+
+
+def test_hydrate_monitors_passes_complete_monitors(fake_api):
+    dd_api = fake_api(get_monitor)
+    monitors = list(
+        hydrate_monitors(dd_api, [full_monitor(1), search_result(2), full_monitor(3)])
+    )
+    assert monitors == [full_monitor(1), full_monitor(2), full_monitor(3)]
+    assert dd_api.requested == [("api/v1/monitor/2", None)]
+
+
+def test_supported_monitors():
+    monitors = [
+        search_result(1),
+        search_result(2, "synthetics alert"),
+        search_result(3, "log alert"),
+    ]
+    assert [monitor["id"] for monitor in supported_monitors(monitors)] == [1, 3]
@@ -0,0 +1,93 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+from datadog_terraform_generator.host_inventory import (
+    STALE_SECONDS,
+    HostRecord,
+    refresh_host_snapshot,
+)
+
+
+def query_params(path):
+    return {
+        ky: int(vl[0])
+        for ky, vl in parse_qs(urlparse(path).query).items()
+        if vl[0].isdigit()
+    }
+
+
+def requested_params(dd_api):
+    return [query_params(path) for path, _ in dd_api.requested]
+
+
+def hosts_handler(hosts):
+    def handle(path, data):
+        params = query_params(path)
+        matching = [
+            h for h in hosts if h["last_reported_time"] >= params.get("from", 0)
+        ]
+        page = matching[params["start"] : params["start"] + params["count"]]
+        return {
+            "host_list": page,
+            "total_returned": len(page),
+            "total_matching": len(matching),
+        }
+
+    return handle
+
+
+def test_refresh_host_snapshot(tmp_path, fake_api):
+    path = str(tmp_path / "hosts.json.gz")
+    now = int(time.time())
+    hosts = [
+        {"id": nr, "name": f"host-{nr}", "last_reported_time": now - 60}
+        for nr in range(2500)
+    ]
+    dd_api = fake_api(hosts_handler(hosts), api_host="host", api_key="key")
+    assert len(refresh_host_snapshot(dd_api, path=path)) == 2500
+    assert len(dd_api.requested) == 3
+    assert "from" not in requested_params(dd_api)[0]
+
+    # one host reports with new tags, one stopped reporting long ago
+    hosts[:] = [
+        {"id": 1, "name": "host-1", "last_reported_time": now, "tags": ["new"]},
+    ]
+    dd_api.requested.clear()
+    snapshot = refresh_host_snapshot(dd_api, path=path)
+    assert len(dd_api.requested) == 1 and "from" in requested_params(dd_api)[0]
+    assert len(snapshot) == 2500
+    assert [h for h in snapshot if h["id"] == 1][0]["tags"] == ["new"]
+
+    hosts.append({"id": 2, "name": "host-2", "last_reported_time": now})
+    full = refresh_host_snapshot(dd_api, path=path, full_refresh=True)
+    assert sorted(h["id"] for h in full) == [1, 2]
+
+
+def test_refresh_host_snapshot_drops_stale_hosts(tmp_path, fake_api):
+    path = str(tmp_path / "hosts.json.gz")
+    now = int(time.time())
+    hosts = [
+        {"id": 1, "name": "old", "last_reported_time": now - STALE_SECONDS - 60},
+        {"id": 2, "name": "new", "last_reported_time": now},
+    ]
+    dd_api = fake_api(hosts_handler(hosts), api_host="host", api_key="key")
+    assert len(refresh_host_snapshot(dd_api, path=path)) == 2
+    assert [h["name"] for h in refresh_host_snapshot(dd_api, path=path)] == ["new"]
+
+
+def test_host_record():
+    record = HostRecord(
+        {
+            "name": "web-1",
+            "tags_by_source": {"Datadog": ["env:prd", "role:web"], "AWS": ["env:prd"]},
+            "meta": {
+                "agent_version": "7.50.0",
+                "gohai": '{"network": {"ipaddress": "10.0.0.1"}}',
+            },
+        }
+    )
+    assert record.tags == ["env:prd", "role:web"]
+    assert record.env == "prd"
+    assert record.agent_version == "7.50.0"
+    assert record.ip == "10.0.0.1"
+    assert HostRecord({"name": "db-1", "tags_by_source": {}}).ip == ""
@@ -0,0 +1,32 @@
+from datadog_terraform_generator.host_snapshot import (
+    HostEntry,
+    diff_snapshots,
+    load_snapshot,
+    save_snapshot,
+    sorted_entries,
+)
+
+
+def entry(name, env="prd", tags_hash="aaaa", agent_version="7.50.0"):
+    return HostEntry(name, env, tags_hash, agent_version)
+
+
+def test_diff_snapshots():
+    old = sorted_entries([entry("a"), entry("b"), entry("c"), entry("e")])
+    new = sorted_entries(
+        [entry("b"), entry("c", agent_version="7.51.0"), entry("d"), entry("e")]
+    )
+    assert list(diff_snapshots(old, new)) == [
+        ("-", entry("a"), None),
+        ("~", entry("c"), entry("c", agent_version="7.51.0")),
+        ("+", None, entry("d")),
+    ]
+    assert list(diff_snapshots([], new)) == [("+", None, e) for e in new]
+    assert list(diff_snapshots(old, [])) == [("-", e, None) for e in old]
+
+
+def test_save_and_load_snapshot(tmp_path):
+    path = str(tmp_path / "hosts.tsv")
+    entries = sorted_entries([entry("b", env=""), entry("a", agent_version="")])
+    save_snapshot(path, entries)
+    assert load_snapshot(path) == entries
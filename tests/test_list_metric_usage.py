@@ -0,0 +1,68 @@
+import pytest
+
+import datadog_terraform_generator.cache as cache
+from datadog_terraform_generator.list_metric_usage import get_metric_list
+
+METRICS = {
+    "kafka.messages.in": 100,
+    "kafka.messages.out": 50,
+    "kong.requests": 30,
+    "kong.latency": 20,
+}
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+def metrics_handler(fail_on=()):
+    def handle(path, data):
+        if path == "api/v2/metrics":
+            return {"data": [{"id": metric_name} for metric_name in METRICS]}
+        metric_name = path.split("/")[3]
+        if metric_name in fail_on:
+            raise ConnectionError("interrupted")
+        return {"data": {"attributes": {"distinct_volume": METRICS[metric_name]}}}
+
+    return handle
+
+
+def requested_volumes(dd_api):
+    return [
+        path.split("/")[3] for path, _ in dd_api.requested if path != "api/v2/metrics"
+    ]
+
+
+def read_csv(path):
+    with open(path) as fl:
+        return sorted(fl.read().splitlines())
+
+
+def test_interrupted_scan_resumes(tmp_path, fake_api):
+    output_path = str(tmp_path / "volumes.csv")
+    dd_api = fake_api(metrics_handler(fail_on={"kafka.messages.out"}))
+    trie = get_metric_list(dd_api, "kafka", output_path=output_path, concurrency=1)
+    assert trie.total == 100
+    assert requested_volumes(dd_api) == ["kafka.messages.in", "kafka.messages.out"]
+
+    dd_api = fake_api(metrics_handler())
+    trie = get_metric_list(dd_api, "kafka", output_path=output_path, concurrency=1)
+    # only the failed metric is requested again
+    assert requested_volumes(dd_api) == ["kafka.messages.out"]
+    assert trie.total == 150
+    assert read_csv(output_path) == ["kafka.messages.in,100", "kafka.messages.out,50"]
+    assert not (tmp_path / "volumes.csv.checkpoint").exists()
+
+
+def test_checkpoint_of_other_prefix_is_ignored(tmp_path, fake_api):
+    output_path = str(tmp_path / "volumes.csv")
+    dd_api = fake_api(metrics_handler(fail_on={"kafka.messages.out"}))
+    get_metric_list(dd_api, "kafka", output_path=output_path, concurrency=1)
+    assert (tmp_path / "volumes.csv.checkpoint").exists()
+
+    dd_api = fake_api(metrics_handler())
+    trie = get_metric_list(dd_api, "kong", output_path=output_path, concurrency=1)
+    assert sorted(requested_volumes(dd_api)) == ["kong.latency", "kong.requests"]
+    assert trie.total == 50
+    assert read_csv(output_path) == ["kong.latency,20", "kong.requests,30"]
@@ -0,0 +1,101 @@
+import arrow
+
+from datadog_terraform_generator.log_aggregate import aggregate_logs, bucket_rows
+
+FROM = arrow.get("2024-01-01T00:00:00+00:00")
+TO = arrow.get("2024-01-02T00:00:00+00:00")
+
+
+def aggregate_handler(pages):
+    pages = iter(pages)
+
+    def handle(path, data):
+        assert path == "api/v2/logs/analytics/aggregate"
+        return next(pages)
+
+    return handle
+
+
+def requested_bodies(dd_api):
+    return [data for _, data in dd_api.requested]
+
+
+def test_aggregate_logs_request(fake_api):
+    dd_api = fake_api(aggregate_handler([{"data": {"buckets": []}}]))
+    result = aggregate_logs(
+        dd_api,
+        FROM,
+        TO,
+        ["main"],
+        "source:kong",
+        group_by=["host", "@http.status_code"],
+        aggregation="pc99",
+        metric="@duration",
+        interval="1h",
+        group_limit=10,
+    )
+    assert list(result) == []
+    sort = {
+        "aggregation": "pc99",
+        "order": "desc",
+        "type": "measure",
+        "metric": "@duration",
+    }
+    assert requested_bodies(dd_api) == [
+        {
+            "compute": [
+                {
+                    "aggregation": "pc99",
+                    "type": "timeseries",
+                    "metric": "@duration",
+                    "interval": "1h",
+                }
+            ],
+            "filter": {
+                "from": FROM.isoformat(),
+                "to": TO.isoformat(),
+                "indexes": ["main"],
+                "query": "source:kong",
+            },
+            "group_by": [
+                {"facet": "host", "limit": 10, "sort": sort},
+                {"facet": "@http.status_code", "limit": 10, "sort": sort},
+            ],
+        }
+    ]
+
+
+def test_aggregate_logs_follows_cursor(fake_api):
+    pages = [
+        {
+            "data": {"buckets": [{"by": {"host": "a"}, "computes": {"c0": 3}}]},
+            "meta": {"page": {"after": "cursor-1"}},
+        },
+        {"data": {"buckets": [{"by": {"host": "b"}, "computes": {"c0": 2}}]}},
+    ]
+    dd_api = fake_api(aggregate_handler(pages))
+    result = aggregate_logs(dd_api, FROM, TO, ["*"], "*", group_by=["host"])
+    assert [bucket["by"]["host"] for bucket in result] == ["a", "b"]
+    requested = requested_bodies(dd_api)
+    assert "page" not in requested[0]
+    assert requested[1]["page"] == {"cursor": "cursor-1"}
+    assert requested[1]["compute"] == [{"aggregation": "count", "type": "total"}]
+
+
+def test_bucket_rows():
+    bucket = {"by": {"host": "web-1"}, "computes": {"c0": 12}}
+    assert list(bucket_rows(bucket, ["host", "service"])) == [["web-1", "", 12]]
+
+    bucket = {
+        "by": {"host": "web-1", "service": "kong"},
+        "computes": {
+            "c0": [
+                {"time": "2024-01-01T00:00:00Z", "value": 5},
+                {"time": "2024-01-01T01:00:00Z", "value": 7},
+            ]
+        },
+    }
+    assert list(bucket_rows(bucket, ["host", "service"])) == [
+        ["web-1", "kong", "2024-01-01T00:00:00Z", 5],
+        ["web-1", "kong", "2024-01-01T01:00:00Z", 7],
+    ]
@@ -0,0 +1,111 @@
+import csv
+import random
+from collections import Counter
+
+from datadog_terraform_generator.log_analytics import (
+    LogStats,
+    SpaceSaving,
+    message_template,
+)
+
+
+def test_message_template():
+    assert (
+        message_template('GET /users/1234 from 10.0.0.12 took 12.5ms user="bob"')
+        == "GET /users/<num> from <ip> took <num>ms user=<str>"
+    )
+
+
+def test_space_saving_keeps_heavy_hitters():
+    sketch = SpaceSaving(k=3)
+    for key in ["a"] * 50 + ["b"] * 30 + list("cdefghij") + ["a"] * 5:
+        sketch.add(key)
+    top = sketch.top(2)
+    assert [key for key, _, _ in top] == ["a", "b"]
+    for key, count, error in top:
+        assert count - error <= {"a": 55, "b": 30}[key] <= count
+
+
+def test_log_stats_per_minute(tmp_path):
+    minutes_path = tmp_path / "minutes.csv"
+    templates_path = tmp_path / "templates.csv"
+    stats = LogStats(str(minutes_path), str(templates_path))
+    for timestamp, host in [
+        ("2024-01-01T00:00:01Z", "a"),
+        ("2024-01-01T00:00:30Z", "a"),
+        ("2024-01-01T00:00:59Z", "b"),
+        ("2024-01-01T00:01:00Z", "a"),
+    ]:
+        stats.on_log(
+            {
+                "attributes": {
+                    "timestamp": timestamp,
+                    "host": host,
+                    "status": "info",
+                    "message": f"request {timestamp[-3:-1]} done",
+                }
+            }
+        )
+    stats.close()
+    with open(minutes_path) as fl:
+        assert list(csv.reader(fl)) == [
+            ["minute", "host", "status", "count"],
+            ["2024-01-01T00:00", "a", "info", "2"],
+            ["2024-01-01T00:00", "b", "info", "1"],
+            ["2024-01-01T00:01", "a", "info", "1"],
+        ]
+    with open(templates_path) as fl:
+        assert list(csv.reader(fl))[1] == ["request <num> done", "4", "0"]
+
+
+def test_space_saving_error_bounds():
+    rnd = random.Random(1)
+    stream = [f"key-{int(rnd.paretovariate(1))}" for _ in range(20_000)]
+    sketch = SpaceSaving(k=20)
+    for key in stream:
+        sketch.add(key)
+    real_counts = Counter(stream)
+    assert len(sketch.heap) == len(sketch.counts) == 20
+    # every log is counted by one of the counters
+    assert sum(count for _, count, _ in sketch.top()) == len(stream)
+    for key, count, error in sketch.top():
+        assert count - error <= real_counts[key] <= count
+    assert [key for key, _, _ in sketch.top(3)] == [
+        key for key, _ in real_counts.most_common(3)
+    ]
+
+
+def test_log_stats_resume(tmp_path):
+    minutes_path = str(tmp_path / "minutes.csv")
+    templates_path = str(tmp_path / "templates.csv")
+
+    def log(minute, second):
+        return {
+            "attributes": {
+                "timestamp": f"2024-01-01T00:{minute:02d}:{second:02d}Z",
+                "host": "a",
+                "status": "info",
+                "message": "done",
+            }
+        }
+
+    stats = LogStats(minutes_path, templates_path)
+    for minute, second in [(0, 1), (0, 2), (1, 1)]:
+        stats.on_log(log(minute, second))
+    stats.close(completed=False)
+    with open(templates_path) as fl:
+        assert list(csv.reader(fl))[1:] == [["done", "2", "0"]]
+
+    stats = LogStats(minutes_path, templates_path, resume_minute="2024-01-01T00:01")
+    for minute, second in [(1, 1), (1, 2), (2, 1)]:
+        stats.on_log(log(minute, second))
+    stats.close()
+    with open(minutes_path) as fl:
+        assert list(csv.reader(fl)) == [
+            ["minute", "host", "status", "count"],
+            ["2024-01-01T00:00", "a", "info", "2"],
+            ["2024-01-01T00:01", "a", "info", "2"],
+            ["2024-01-01T00:02", "a", "info", "1"],
+        ]
+    with open(templates_path) as fl:
+        assert list(csv.reader(fl))[1:] == [["done", "5", "0"]]
@@ -0,0 +1,52 @@
+import json
+import os
+
+import arrow
+
+from datadog_terraform_generator.log_index import get_index_path, search
+
+
+def write_export(path):
+    logs = [
+        {"id": "1", "timestamp": "2024-01-01T00:00:10Z", "host": "a", "service": "x"},
+        {"id": "2", "timestamp": "2024-01-01T00:00:50Z", "host": "b", "service": "x"},
+        {"id": "3", "timestamp": "2024-01-01T00:01:10Z", "host": "a", "service": "y"},
+        {"id": "4", "timestamp": "2024-01-01T00:02:30Z", "host": "b", "service": "y"},
+        {"id": "5", "timestamp": "2024-01-01T00:03:00Z", "host": "a", "service": "x"},
+    ]
+    with open(path, "w") as fl:
+        for log in logs:
+            fl.write(json.dumps(log) + "\n")
+
+
+def ids(lines):
+    return [json.loads(line)["id"] for line in lines]
+
+
+def test_search(tmp_path):
+    path = str(tmp_path / "logs.ndjson")
+    write_export(path)
+    assert ids(search(path)) == ["1", "2", "3", "4", "5"]
+    assert os.path.isfile(get_index_path(path))
+    assert ids(search(path, host="a")) == ["1", "3", "5"]
+    assert ids(search(path, service="y")) == ["3", "4"]
+    assert ids(
+        search(
+            path,
+            _from=arrow.get("2024-01-01T00:00:30Z"),
+            to=arrow.get("2024-01-01T00:02:30Z"),
+        )
+    ) == ["2", "3", "4"]
+    assert ids(search(path, host="c")) == []
+
+
+def test_index_rebuilt_when_export_changes(tmp_path):
+    path = str(tmp_path / "logs.ndjson")
+    write_export(path)
+    assert ids(search(path, host="b")) == ["2", "4"]
+    with open(path, "a") as fl:
+        fl.write(
+            json.dumps({"id": "6", "timestamp": "2024-01-01T00:04:00Z", "host": "b"})
+            + "\n"
+        )
+    assert ids(search(path, host="b")) == ["2", "4", "6"]
@@ -0,0 +1,105 @@
+import gzip
+import io
+import json
+import os
+
+from mock import Mock
+
+import datadog_terraform_generator.log_sink as log_sink
+from datadog_terraform_generator.log_sink import LogSink, rotated_path
+
+
+def make_log(nr, second):
+    return {
+        "id": f"log-{nr}",
+        "attributes": {
+            "timestamp": f"2024-01-01T00:00:{second:02d}Z",
+            "host": "web-1",
+            "message": f"message {nr}",
+        },
+    }
+
+
+def read_ids(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as fl:
+        return [json.loads(line)["id"] for line in fl]
+
+
+def test_batches_are_written_in_order(tmp_path):
+    path = str(tmp_path / "logs.ndjson")
+    sink = LogSink(output_path=path, batch_size=3)
+    for nr in range(7):
+        sink.write(make_log(nr, nr))
+    # the last log waits for a full batch or close
+    assert len(sink.batch) == 1
+    sink.close()
+    assert read_ids(path) == [f"log-{nr}" for nr in range(7)]
+    assert sink.count == 7
+
+
+def test_rotation(tmp_path):
+    path = str(tmp_path / "logs.ndjson")
+    sink = LogSink(output_path=path, compression="gzip", batch_size=2, rotate_bytes=1)
+    for nr in range(5):
+        sink.write(make_log(nr, nr))
+    sink.close()
+    paths = [rotated_path(f"{path}.gz", file_index) for file_index in range(3)]
+    assert paths[1] == str(tmp_path / "logs-00001.ndjson.gz")
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in paths)
+    assert [read_ids(p) for p in paths] == [
+        ["log-0", "log-1"],
+        ["log-2", "log-3"],
+        ["log-4"],
+    ]
+
+
+def test_checkpoint_and_resume(tmp_path):
+    path = str(tmp_path / "logs.ndjson")
+    checkpoint_path = f"{path}.checkpoint"
+    sink = LogSink(output_path=path, batch_size=2, checkpoint_path=checkpoint_path)
+    # log 2 and 3 have the same timestamp, the export stops in between
+    for nr, second in [(0, 0), (1, 1), (2, 5)]:
+        sink.write(make_log(nr, second))
+    sink.close(completed=False)
+    with open(checkpoint_path) as fl:
+        checkpoint = json.load(fl)
+    assert checkpoint["timestamp"] == "2024-01-01T00:00:05Z"
+    assert checkpoint["ids"] == ["log-2"]
+    assert checkpoint["count"] == 3
+
+    sink = LogSink(output_path=path, batch_size=2, checkpoint_path=checkpoint_path)
+    assert sink.resume_timestamp == "2024-01-01T00:00:05Z"
+    assert sink.count == 3
+    # the export restarts at the checkpoint timestamp
+    for nr, second in [(2, 5), (3, 5), (4, 6)]:
+        item = make_log(nr, second)
+        if not sink.already_written(item):
+            sink.write(item)
+    sink.close()
+    assert not os.path.isfile(checkpoint_path)
+    assert read_ids(path) == [f"log-{nr}" for nr in range(5)]
+
+
+def test_already_written(tmp_path):
+    checkpoint_path = str(tmp_path / "logs.checkpoint")
+    with open(checkpoint_path, "w") as fl:
+        json.dump({"timestamp": "2024-01-01T00:00:05Z", "ids": ["log-2"]}, fl)
+    sink = LogSink(output_path=str(tmp_path / "logs"), checkpoint_path=checkpoint_path)
+    assert sink.already_written(make_log(1, 4))
+    assert sink.already_written(make_log(2, 5))
+    assert not sink.already_written(make_log(3, 5))
+    assert not sink.already_written(make_log(2, 6))
+    sink.close(completed=False)
+
+
+def test_compressed_stdout(monkeypatch):
+    stdout = Mock(buffer=io.BytesIO())
+    monkeypatch.setattr(log_sink.sys, "stdout", stdout)
+    sink = LogSink(compression="gzip", batch_size=2)
+    for nr in range(3):
+        sink.write(make_log(nr, nr))
+    sink.close()
+    lines = gzip.decompress(stdout.buffer.getvalue()).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["log-0", "log-1", "log-2"]
+    assert not stdout.buffer.closed
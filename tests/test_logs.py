@@ -0,0 +1,220 @@
+import argparse
+import csv
+import json
+import queue
+import threading
+import time
+
+import arrow
+import pytest
+from mock import Mock
+
+import datadog_terraform_generator.logs as logs
+from datadog_terraform_generator.logs import (
+    compile_fields,
+    get_time_sliced_logs,
+    produce_window_pages,
+    project_log_item,
+)
+
+START = arrow.get("2024-01-01T00:00:00+00:00")
+
+
+def make_log(nr, minutes):
+    return {
+        "id": f"log-{nr}",
+        "attributes": {
+            "timestamp": START.shift(minutes=minutes).isoformat(),
+            "host": f"host-{nr % 3}",
+            "attributes": {"http": {"status_code": 200}},
+        },
+    }
+
+
+def logs_handler(all_logs):
+    """
+    Both ends of the time range are inclusive, like a log exactly on the border
+    of two windows can be returned for both
+    """
+
+    def handle(path, data):
+        _from, to = arrow.get(data["filter"]["from"]), arrow.get(data["filter"]["to"])
+        matching = [
+            log
+            for log in all_logs
+            if _from <= arrow.get(log["attributes"]["timestamp"]) <= to
+        ]
+        start = int(data["page"].get("cursor", 0))
+        end = start + data["page"]["limit"]
+        page = {"data": matching[start:end]}
+        if end < len(matching):
+            page["meta"] = {"page": {"after": str(end)}}
+        return page
+
+    return handle
+
+
+def test_get_time_sliced_logs_in_order(fake_api):
+    all_logs = [make_log(nr, nr) for nr in range(0, 120, 7)]
+    dd_api = fake_api(logs_handler(all_logs))
+    result = get_time_sliced_logs(
+        dd_api, START, START.shift(minutes=120), ["*"], "*", windows=4
+    )
+    assert [log["id"] for log in result] == [log["id"] for log in all_logs]
+
+
+def test_get_time_sliced_logs_dedups_window_borders(fake_api):
+    # 30 and 60 minutes are the borders of the windows
+    all_logs = [make_log(nr, minutes) for nr, minutes in enumerate([10, 30, 60, 70])]
+    dd_api = fake_api(logs_handler(all_logs))
+    result = get_time_sliced_logs(
+        dd_api, START, START.shift(minutes=120), ["*"], "*", windows=4
+    )
+    assert [log["id"] for log in result] == ["log-0", "log-1", "log-2", "log-3"]
+
+
+def test_get_time_sliced_logs_stops_early(monkeypatch, fake_api):
+    monkeypatch.setattr(logs, "list_logs", wrap_page_size(logs.list_logs, 1))
+    all_logs = [make_log(nr, nr) for nr in range(120)]
+    dd_api = fake_api(logs_handler(all_logs))
+    threads_before = threading.active_count()
+
+    result = get_time_sliced_logs(
+        dd_api,
+        START,
+        START.shift(minutes=120),
+        ["*"],
+        "*",
+        windows=4,
+        max_buffered_pages=1,
+    )
+    assert next(result)["id"] == "log-0"
+    result.close()
+
+    deadline = time.time() + 5
+    while threading.active_count() > threads_before and time.time() < deadline:
+        time.sleep(0.05)
+    assert threading.active_count() <= threads_before
+    # every window fetched a few pages ahead at most
+    assert len(dd_api.requested) < 20
+
+
+def wrap_page_size(list_logs, limit):
+    def list_small_pages(*args, **kwargs):
+        return list_logs(*args, limit=limit, **kwargs)
+
+    return list_small_pages
+
+
+def test_produce_window_pages_returns_when_stopped_with_full_queue():
+    page_queue = queue.Queue(maxsize=1)
+    page_queue.put({"data": []})
+    stop = threading.Event()
+    stop.set()
+    producer = threading.Thread(
+        target=produce_window_pages,
+        args=((page for page in []), page_queue, stop),
+        daemon=True,
+    )
+    producer.start()
+    producer.join(timeout=2)
+    assert not producer.is_alive()
+
+
+def test_compile_fields():
+    assert compile_fields(None) is None
+    assert compile_fields(["host", "attributes.http.status_code", "timestamp"]) == [
+        ("timestamp",),
+        ("host",),
+        ("attributes", "http", "status_code"),
+    ]
+
+
+def test_project_log_item():
+    item = make_log(1, 0)
+    field_paths = compile_fields(
+        ["attributes.http.status_code", "attributes.http.method", "service.name"]
+    )
+    assert project_log_item(item, field_paths) == {
+        "id": "log-1",
+        "attributes": {
+            "timestamp": item["attributes"]["timestamp"],
+            "attributes": {"http": {"status_code": 200}},
+        },
+    }
+    # host is a string, there's nothing below it
+    assert project_log_item(item, compile_fields(["host.name"])) == {
+        "id": "log-1",
+        "attributes": {"timestamp": item["attributes"]["timestamp"]},
+    }
+
+
+def test_projection_leaves_the_response_alone(monkeypatch):
+    # the response may be shared with whoever else got it
+    page = {"data": [make_log(nr, nr) for nr in range(5)]}
+    monkeypatch.setattr(logs, "list_logs", Mock(return_value=page))
+    result = get_time_sliced_logs(
+        Mock(), START, START.shift(minutes=10), ["*"], "*", windows=1, fields=["host"]
+    )
+    assert [set(log["attributes"]) for log in result] == [{"timestamp", "host"}] * 5
+    assert page["data"] == [make_log(nr, nr) for nr in range(5)]
+
+
+def run_export(args_list):
+    parser = argparse.ArgumentParser()
+    logs.add_sub_parser(parser.add_subparsers())
+    args = parser.parse_args(["logs"] + args_list)
+    args.config_name = None
+    logs.main(args)
+
+
+def test_export_with_stats_resumes(tmp_path, monkeypatch, fake_api):
+    monkeypatch.setattr(logs, "list_logs", wrap_page_size(logs.list_logs, 2))
+    monkeypatch.setattr(logs, "get_config_by_name", Mock())
+    all_logs = [make_log(nr, nr // 2 + nr % 2 * 0.5) for nr in range(6)]
+    for log in all_logs:
+        log["attributes"]["host"] = "web-1"
+        log["attributes"]["message"] = f"request {log['id']} done"
+    handle = logs_handler(all_logs)
+    failed = []
+
+    def fail_once(path, data):
+        # the third page fails the first time
+        if data["page"].get("cursor") == "4" and not failed:
+            failed.append(path)
+            raise ConnectionError("interrupted")
+        return handle(path, data)
+
+    dd_api = fake_api(fail_once)
+    monkeypatch.setattr(logs, "DdApi", Mock(from_config=Mock(return_value=dd_api)))
+    output = str(tmp_path / "logs.ndjson")
+    args_list = [
+        "--from",
+        START.isoformat(),
+        "--to",
+        START.shift(minutes=10).isoformat(),
+        "--windows",
+        "1",
+        "--output",
+        output,
+        "--fields",
+        "attributes.http.status_code",
+        "--stats",
+    ]
+    with pytest.raises(ConnectionError):
+        run_export(args_list)
+    run_export(args_list)
+
+    with open(output) as fl:
+        exported = [json.loads(line) for line in fl]
+    assert [log["id"] for log in exported] == [log["id"] for log in all_logs]
+    # the fields of the stats aren't exported
+    assert set(exported[0]) == {"id", "timestamp", "attributes"}
+    with open(f"{output}.minutes.csv") as fl:
+        assert [row[0] + " " + row[3] for row in csv.reader(fl)][1:] == [
+            START.isoformat()[:16] + " 2",
+            START.shift(minutes=1).isoformat()[:16] + " 2",
+            START.shift(minutes=2).isoformat()[:16] + " 2",
+        ]
+    with open(f"{output}.templates.csv") as fl:
+        assert list(csv.reader(fl))[1:] == [["request log-<num> done", "6", "0"]]
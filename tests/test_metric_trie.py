@@ -0,0 +1,34 @@
+import pytest
+
+from datadog_terraform_generator.metric_trie import MetricTrie
+
+
+@pytest.fixture
+def trie():
+    trie = MetricTrie()
+    trie.insert("kafka.consumer.lag", 50)
+    trie.insert("kafka.consumer.offset", 20)
+    trie.insert("kafka.producer.rate", 10)
+    trie.insert("kafka", 5)
+    trie.insert("kong.latency", 15)
+    return trie
+
+
+def test_rollup_at_any_depth(trie):
+    assert dict(trie.rollup(1)) == {"kafka": 85, "kong": 15}
+    assert dict(trie.rollup(2)) == {
+        "kafka": 5,
+        "kafka.consumer": 70,
+        "kafka.producer": 10,
+        "kong.latency": 15,
+    }
+    assert dict(trie.rollup(1, prefix="kafka.consumer")) == {
+        "kafka.consumer.lag": 50,
+        "kafka.consumer.offset": 20,
+    }
+
+
+def test_top_and_percentage(trie):
+    assert trie.top(2, 2) == [("kafka.consumer", 70), ("kong.latency", 15)]
+    assert trie.percentage("kafka.consumer") == pytest.approx(70)
+    assert trie.percentage("unknown") == 0
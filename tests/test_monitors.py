@@ -0,0 +1,92 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from datadog_terraform_generator.monitors import (
+    get_monitors_by_query,
+    search_monitors,
+)
+
+
+def query_params(path):
+    return {ky: vl[0] for ky, vl in parse_qs(urlparse(path).query).items()}
+
+
+def requested_params(dd_api):
+    return [query_params(path) for path, _ in dd_api.requested]
+
+
+def search_handler(monitors, per_page):
+    """
+    api/v1/monitor/search stub, later pages are answered faster so the parallel
+    requests come back out of order
+    """
+    page_count = (len(monitors) + per_page - 1) // per_page
+
+    def handle(path, data):
+        assert urlparse(path).path == "api/v1/monitor/search"
+        page = int(query_params(path)["page"])
+        time.sleep(0.01 * max(page_count - page, 0))
+        start, end = page * per_page, (page + 1) * per_page
+        return {
+            "monitors": monitors[start:end],
+            "metadata": {"page": page, "page_count": page_count},
+        }
+
+    return handle
+
+
+def make_monitors(count):
+    return [
+        {
+            "id": nr,
+            "name": f"monitor {nr}",
+            "tags": ["team:a", f"nr:{nr}"],
+            "notifications": [{"handle": "slack-a"}, {"handle": "pager"}],
+            "query": f'avg(last_5m):avg:kong.latency{{service:"{nr}"}} > 1',
+        }
+        for nr in range(count)
+    ]
+
+
+@pytest.mark.parametrize("count", [1, 3, 10, 11])
+def test_search_monitors(fake_api, count):
+    dd_api = fake_api(search_handler(make_monitors(count), per_page=3))
+    monitors = list(search_monitors(dd_api, "team:a", per_page=3, concurrency=4))
+    assert [monitor["id"] for monitor in monitors] == list(range(count))
+    params = requested_params(dd_api)
+    assert all(p["per_page"] == "3" and p["query"] == "team:a" for p in params)
+    # the first page tells the page count, then pages 1..page_count-1 follow
+    page_count = (count + 2) // 3
+    assert params[0]["page"] == "0"
+    assert sorted(int(p["page"]) for p in params[1:]) == list(range(1, page_count))
+
+
+def test_search_monitors_without_results(fake_api):
+    dd_api = fake_api(search_handler([], per_page=3))
+    assert list(search_monitors(dd_api, "team:b", per_page=3)) == []
+    assert [int(p["page"]) for p in requested_params(dd_api)] == [0]
+
+
+def test_get_monitors_by_query(fake_api, capsys):
+    dd_api = fake_api(search_handler(make_monitors(10), per_page=2))
+    get_monitors_by_query(dd_api, "team:a", per_page=2, concurrency=5)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "id,name,tags,notifications,query"
+    assert lines[1] == (
+        '0,monitor 0,"team:a,nr:0","slack-a,pager",'
+        '"avg(last_5m):avg:kong.latency{service:""0""} > 1"'
+    )
+    assert [line.split(",")[0] for line in lines[1:-1]] == [str(nr) for nr in range(10)]
+    assert lines[-1] == "Count: 10"
+
+
+def test_get_monitors_by_query_without_results(fake_api, capsys):
+    dd_api = fake_api(search_handler([], per_page=2))
+    get_monitors_by_query(dd_api, "team:b", per_page=2)
+    assert capsys.readouterr().out.splitlines() == [
+        "id,name,tags,notifications,query",
+        "Count: 0",
+    ]
+    assert len(dd_api.requested) == 1
@@ -0,0 +1,69 @@
+import random
+import threading
+import time
+
+from datadog_terraform_generator.pagination import (
+    iter_counted_pages,
+    iter_items,
+    iter_pages,
+    iter_parallel_pages,
+)
+
+
+def test_iter_pages_follows_cursors():
+    pages = {None: ("a", [1, 2]), "a": ("b", [3]), "b": (None, [4, 5])}
+
+    def fetch_page(cursor):
+        next_cursor, items = pages[cursor]
+        return {"next": next_cursor, "items": items}
+
+    result = iter_items(
+        iter_pages(fetch_page, lambda page: page["next"]), lambda page: page["items"]
+    )
+    assert list(result) == [1, 2, 3, 4, 5]
+
+
+def test_iter_pages_prefetches_next_page():
+    fetched = []
+    next_fetched = threading.Event()
+
+    def fetch_page(nr):
+        fetched.append(nr)
+        if nr == 1:
+            next_fetched.set()
+        return {"nr": nr}
+
+    pages = iter_pages(fetch_page, lambda page: page["nr"] + 1, first_token=0)
+    assert next(pages) == {"nr": 0}
+    # the next page is fetched without asking for it
+    assert next_fetched.wait(timeout=1)
+    pages.close()
+
+
+def test_iter_parallel_pages_keeps_order():
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def fetch_page(nr):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(random.uniform(0, 0.02))
+        with lock:
+            in_flight[0] -= 1
+        return nr
+
+    assert list(iter_parallel_pages(fetch_page, range(20), concurrency=4)) == list(
+        range(20)
+    )
+    assert in_flight[1] <= 4
+
+
+def test_iter_counted_pages():
+    def fetch_page(page):
+        return {"page": page, "page_count": 3}
+
+    pages = iter_counted_pages(
+        fetch_page, lambda first: range(1, first["page_count"]), first_token=0
+    )
+    assert [page["page"] for page in pages] == [0, 1, 2]
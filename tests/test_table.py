@@ -0,0 +1,318 @@
+import math
+import random
+import re
+from urllib.parse import parse_qs, urlparse
+
+import arrow
+import pytest
+
+import datadog_terraform_generator.metric_aggregators as metric_aggregators
+from datadog_terraform_generator.table import (
+    batch_queries,
+    plan_query,
+    query_metrics,
+    split_into_chunks,
+)
+
+
+ROLLUP_FUNCTIONS = {"max": max, "min": min, "sum": sum, "count": len}
+
+
+def rollup(pointlist, function, window):
+    windows = {}
+    for timestamp, value in pointlist:
+        if value is None:
+            continue
+        windows.setdefault(timestamp // window * window, []).append(value)
+    return [
+        [timestamp, ROLLUP_FUNCTIONS[function](values)]
+        for timestamp, values in sorted(windows.items())
+    ]
+
+
+SPACE_AGGREGATIONS = {
+    "avg": lambda values: sum(values) / len(values),
+    "sum": sum,
+    "max": max,
+    "min": min,
+}
+
+
+def space_aggregate(pointlists, space_aggregation):
+    values_per_timestamp = {}
+    for pointlist in pointlists:
+        for timestamp, value in pointlist:
+            values = values_per_timestamp.setdefault(timestamp, [])
+            if value is not None:
+                values.append(value)
+    return [
+        [timestamp, SPACE_AGGREGATIONS[space_aggregation](values) if values else None]
+        for timestamp, values in sorted(values_per_timestamp.items())
+    ]
+
+
+def query_handler(points, returned_points=None):
+    """
+    api/v1/query stub, points holds the pointlist per metric name and series (tag
+    set). Like Datadog, the rollup is applied per series, after which the series
+    are combined per group with the space aggregation. The points of all returned
+    series are added to returned_points.
+    """
+
+    def handle(path, data):
+        series = []
+        params = parse_qs(urlparse(path).query)
+        _from, to = int(params["from"][0]), int(params["to"][0])
+        # commas outside of braces and parentheses separate the queries
+        queries = re.split(r",(?![^{(]*[})])", params["query"][0])
+        for query_index, qry in enumerate(queries):
+            space_aggregation, qry_rest = qry.split(":", 1)
+            metric_name = qry_rest.split("{", 1)[0]
+            group_by_match = re.search(r" by \{([^}]*)\}", qry)
+            group_by = group_by_match.group(1).split(",") if group_by_match else []
+            rollup_match = re.search(r"\.rollup\((\w+), (\d+)\)", qry)
+            groups = {}
+            for series_tags, pointlist in points[metric_name].items():
+                pointlist = [p for p in pointlist if _from <= p[0] <= to]
+                if rollup_match:
+                    function, window = rollup_match.groups()
+                    pointlist = rollup(pointlist, function, int(window))
+                group_tags = tuple(
+                    tag
+                    for tag in series_tags.split(",")
+                    if tag.split(":")[0] in group_by
+                )
+                groups.setdefault(group_tags, []).append(pointlist)
+            for group_tags, pointlists in groups.items():
+                pointlist = space_aggregate(pointlists, space_aggregation)
+                if returned_points is not None:
+                    returned_points.extend(pointlist)
+                series.append(
+                    {
+                        "metric": metric_name,
+                        "query_index": query_index,
+                        "tag_set": list(group_tags),
+                        "pointlist": pointlist,
+                    }
+                )
+        return {"series": series}
+
+    return handle
+
+
+def requested_paths(dd_api):
+    return [path for path, _ in dd_api.requested]
+
+
+def test_batch_queries():
+    assert batch_queries(["a", "b", "c"], max_queries=2) == [[0, 1], [2]]
+    assert batch_queries(["aaa", "bbb", "c"], max_length=7) == [[0, 1], [2]]
+    assert batch_queries(["aaaaaaaaaa", "b"], max_length=5) == [[0], [1]]
+
+
+def test_query_metrics_batches_and_demuxes(fake_api):
+    points = {
+        "queue.messages": {
+            "queue:a": [[0, 1.0], [1, 5.0], [2, None]],
+            "queue:b": [[0, 3.0]],
+        },
+        "queue.consumers": {"queue:a": [[0, 2.0], [1, 1.0]]},
+    }
+    dd_api = fake_api(query_handler(points))
+    metric_aggregations, metric_data = query_metrics(
+        agg_metric_names=["max:queue.messages", "min:queue.consumers"],
+        dd_api=dd_api,
+        filter_str="*",
+        group_by_str=" by {queue}",
+        from_arrow=arrow.get(0),
+        to_arrow=arrow.get(3600),
+    )
+    assert len(requested_paths(dd_api)) == 1
+    assert metric_aggregations == {"queue.messages": "max", "queue.consumers": "min"}
+    assert metric_data == {
+        "queue:a": {"queue.messages": 5.0, "queue.consumers": 1.0},
+        "queue:b": {"queue.messages": 3.0},
+    }
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_aggregators(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(metric_aggregators, "numpy", None)
+    elif metric_aggregators.numpy is None:
+        pytest.skip("numpy isn't installed")
+    pointlists = [[[0, 2.0], [1, None], [2, 4.0]], [[3, 6.0]], [], [[4, None]]]
+    expected = {
+        "min": 2.0,
+        "max": 6.0,
+        "avg": 4.0,
+        "sum": 12.0,
+        "count": 3,
+        "stddev": pytest.approx(math.sqrt(8 / 3)),
+        "first": 2.0,
+        "last": 6.0,
+    }
+    for aggregation, result in expected.items():
+        aggregator = metric_aggregators.SUPPORTED_AGGRETATIONS[aggregation]()
+        for pointlist in pointlists:
+            aggregator.on_values(metric_aggregators.series_values(pointlist))
+        assert aggregator.get_result() == result, aggregation
+
+
+def test_percentiles_exact_for_few_values():
+    aggregator = metric_aggregators.SUPPORTED_AGGRETATIONS["p90"]()
+    aggregator.on_values(list(range(1, 101)))
+    assert aggregator.get_result() == 90
+
+
+def test_percentile_sketch_stays_small_and_merges():
+    random.seed(1)
+    parts = []
+    for _ in range(4):
+        aggregator = metric_aggregators.SUPPORTED_AGGRETATIONS["p99"]()
+        aggregator.on_values([random.random() for _ in range(50_000)])
+        parts.append(aggregator)
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert merged.sketch.size < 1000
+    assert merged.get_result() == pytest.approx(0.99, abs=0.01)
+
+
+@pytest.mark.parametrize(
+    "aggregation", ["min", "max", "avg", "sum", "count", "stddev", "first", "last"]
+)
+def test_merged_aggregators_match_single_pass(aggregation):
+    constructor = metric_aggregators.SUPPORTED_AGGRETATIONS[aggregation]
+    values = [3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0, 6.0]
+    single = constructor()
+    single.on_values(values)
+    first_half, second_half = constructor(), constructor()
+    first_half.on_values(values[:3])
+    second_half.on_values(values[3:])
+    first_half.merge(second_half)
+    assert first_half.get_result() == pytest.approx(single.get_result())
+
+
+def test_split_into_chunks():
+    assert split_into_chunks(arrow.get(0), arrow.get(100), 0) == [
+        (arrow.get(0), arrow.get(100))
+    ]
+    assert split_into_chunks(arrow.get(0), arrow.get(250), 100) == [
+        (arrow.get(0), arrow.get(99)),
+        (arrow.get(100), arrow.get(199)),
+        (arrow.get(200), arrow.get(250)),
+    ]
+    # chunks start at multiples of chunk_seconds
+    assert split_into_chunks(arrow.get(150), arrow.get(400), 100) == [
+        (arrow.get(150), arrow.get(199)),
+        (arrow.get(200), arrow.get(299)),
+        (arrow.get(300), arrow.get(400)),
+    ]
+    assert split_into_chunks(arrow.get(150), arrow.get(180), 100) == [
+        (arrow.get(150), arrow.get(180))
+    ]
+
+
+@pytest.mark.parametrize("pushdown", [True, False])
+def test_query_metrics_merges_chunks(pushdown, fake_api):
+    points = {
+        "queue.messages": {"queue:a": [[t, float(t % 7)] for t in range(0, 1000, 10)]}
+    }
+    for aggregation, expected in [
+        ("max", 6.0),
+        ("min", 0.0),
+        ("sum", sum(float(t % 7) for t in range(0, 1000, 10))),
+        ("count", 100),
+        ("first", 0.0),
+        ("last", 990 % 7),
+    ]:
+        returned_points = []
+        dd_api = fake_api(query_handler(points, returned_points))
+        _, metric_data = query_metrics(
+            agg_metric_names=[f"{aggregation}:queue.messages"],
+            dd_api=dd_api,
+            filter_str="*",
+            group_by_str=" by {queue}",
+            from_arrow=arrow.get(0),
+            to_arrow=arrow.get(1000),
+            chunk_seconds=100,
+            pushdown=pushdown,
+        )
+        assert metric_data == {"queue:a": {"queue.messages": expected}}, aggregation
+        paths = requested_paths(dd_api)
+        if pushdown and aggregation in ("max", "min"):
+            # one request over the whole time range
+            assert len(paths) == 1
+            assert "from=0&to=1000" in paths[0] and "rollup" in paths[0]
+            assert len(returned_points) <= 2
+        else:
+            assert len(paths) == 10
+            assert len(returned_points) == 100
+
+
+def test_plan_query():
+    assert plan_query("max", "m", "*", " by {a,b}", 3600) == (
+        "max:m{*} by {a,b}.rollup(max, 3600)",
+        "max",
+    )
+    assert plan_query("count", "m", "*", "", 60) == ("avg:m{*}", "count")
+    assert plan_query("sum", "m", "*", "", 60) == ("sum:m{*}", "sum")
+    assert plan_query("p99", "m", "*", "", 60) == ("avg:m{*}", "p99")
+    assert plan_query("max", "m", "*", "", 60, pushdown=False) == ("max:m{*}", "max")
+
+
+@pytest.mark.parametrize("pushdown", [True, False])
+def test_query_metrics_several_series_per_group(pushdown, fake_api):
+    # two hosts report the queue, with points at the same timestamps
+    points = {
+        "queue.messages": {
+            f"queue:a,host:{host}": [[t, float(host)] for t in range(50, 350, 10)]
+            for host in (1, 2)
+        }
+    }
+    for aggregation, expected in [
+        ("max", 2.0),
+        ("min", 1.0),
+        ("sum", 3.0 * 30),
+        ("count", 30),
+    ]:
+        dd_api = fake_api(query_handler(points))
+        _, metric_data = query_metrics(
+            agg_metric_names=[f"{aggregation}:queue.messages"],
+            dd_api=dd_api,
+            filter_str="*",
+            group_by_str=" by {queue}",
+            from_arrow=arrow.get(50),
+            to_arrow=arrow.get(350),
+            chunk_seconds=100,
+            pushdown=pushdown,
+        )
+        paths = requested_paths(dd_api)
+        assert len(paths) == (1 if pushdown and aggregation in ("max", "min") else 4)
+        assert metric_data == {"queue:a": {"queue.messages": expected}}, aggregation
+
+
+def test_query_metrics_chunks_only_what_needs_points(fake_api):
+    points = {
+        metric_name: {"queue:a": [[t, float(t % 7)] for t in range(0, 1000, 10)]}
+        for metric_name in ("queue.messages", "queue.consumers", "queue.age")
+    }
+    dd_api = fake_api(query_handler(points))
+    _, metric_data = query_metrics(
+        agg_metric_names=["max:queue.messages", "min:queue.age", "p50:queue.consumers"],
+        dd_api=dd_api,
+        filter_str="*",
+        group_by_str=" by {queue}",
+        from_arrow=arrow.get(0),
+        to_arrow=arrow.get(1000),
+        chunk_seconds=100,
+    )
+    assert metric_data == {
+        "queue:a": {"queue.messages": 6.0, "queue.age": 0.0, "queue.consumers": 3.0}
+    }
+    # max and min share one request over the whole range, p50 is chunked
+    paths = requested_paths(dd_api)
+    assert len(paths) == 11
+    assert paths[0].count("rollup") == 2
+    assert not any("rollup" in path for path in paths[1:])
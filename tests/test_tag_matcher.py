@@ -0,0 +1,43 @@
+import pytest
+
+from datadog_terraform_generator.tag_matcher import (
+    TagTerm,
+    compile_tags_pattern,
+    index_tags,
+)
+
+TAGS = ["env:prd", "role:web", "role:cache", "team:platform", "linux"]
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        ("env:prd", True),
+        ("env:acc", False),
+        ("env:acc,role:we*", True),
+        ("env:acc or role:db", False),
+        ("env:prd and role:cache", True),
+        ("env:prd role:db", False),
+        ("env:prd and not role:db*", True),
+        ("not role:web", False),
+        ("(env:acc,env:prd) and (team:plat* or team:data)", True),
+        ("not (env:acc,env:tst)", True),
+        ("linux", True),
+        ("windows", False),
+        ("team:*", True),
+    ],
+)
+def test_compile_tags_pattern(pattern, expected):
+    assert compile_tags_pattern(pattern).matches(index_tags(TAGS)) == expected
+
+
+def test_or_on_same_key_is_one_term():
+    matcher = compile_tags_pattern("env:prd,env:acc,env:tst*")
+    assert isinstance(matcher, TagTerm)
+    assert matcher.matches(index_tags(["env:tst2"]))
+
+
+@pytest.mark.parametrize("pattern", ["env:prd and", "(env:prd", "env:prd)", "or"])
+def test_invalid_pattern(pattern):
+    with pytest.raises(ValueError):
+        compile_tags_pattern(pattern)